@@ -0,0 +1,121 @@
+import time
+import tarfile
+import zipfile
+import importlib.util
+
+# zstd compression is optional and only imported once an archive needs it
+HAS_ZSTANDARD = importlib.util.find_spec("zstandard") is not None
+
+ARCHIVE_FORMATS = {"zip": ".zip", "tar": ".tar", "tar.zst": ".tar.zst"}
+
+def available_formats():
+    """Archive formats usable with the installed modules"""
+    return [fmt for fmt in ARCHIVE_FORMATS if fmt != "tar.zst" or HAS_ZSTANDARD]
+
+def archive_name(name, fmt):
+    """Make sure an archive name carries its format's extension"""
+    extension = ARCHIVE_FORMATS[fmt]
+    return name if name.endswith(extension) else f"{name}{extension}"
+
+def format_for_name(name):
+    """Guess the archive format from a file name, defaulting to zip"""
+    for fmt in ("tar.zst", "tar"):
+        if name.endswith(ARCHIVE_FORMATS[fmt]):
+            return fmt
+    return "zip"
+
+class _OutputBuffer:
+    """Non-seekable file object that hands zipfile output to the archive"""
+    def __init__(self, archive):
+        self.archive = archive
+
+    def write(self, data):
+        self.archive._emit(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+class ArchiveWriter:
+    """
+    Build a tar, tar.zst or zip archive incrementally in memory.
+    Members are fed chunk by chunk and the produced bytes are taken with
+    read_pending() after every call, so the archive can be streamed
+    straight into an uploader without ever existing on disk. Tar needs each
+    member's size up front; zip writes data descriptors and doesn't.
+    """
+    def __init__(self, fmt="zip"):
+        if fmt not in available_formats():
+            raise ValueError(f"Unsupported archive format: {fmt}")
+        self.fmt = fmt
+        self._pending = bytearray()
+        self._compressor = None
+        if fmt == "tar.zst":
+            import zstandard
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        self._zip = zipfile.ZipFile(_OutputBuffer(self), "w", zipfile.ZIP_DEFLATED) if fmt == "zip" else None
+        self._member = None
+        self._member_size = None
+        self._member_written = 0
+
+    def _emit(self, data):
+        if self._compressor:
+            data = self._compressor.compress(data)
+        self._pending += data
+
+    def start_member(self, name, size=None, mtime=None):
+        """Begin a new archive member"""
+        mtime = mtime or time.time()
+        self._member_size = size
+        self._member_written = 0
+        if self._zip:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = size or 0
+            # Unknown sizes might exceed 4 GiB, so reserve zip64 fields
+            self._member = self._zip.open(info, "w", force_zip64=size is None)
+            return
+        if size is None:
+            raise ValueError(f"Size of {name} is unknown, use the zip format instead")
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        self._emit(info.tobuf(format=tarfile.PAX_FORMAT))
+
+    def write(self, chunk):
+        """Add data to the current member"""
+        self._member_written += len(chunk)
+        if self._zip:
+            self._member.write(chunk)
+        else:
+            self._emit(chunk)
+
+    def end_member(self):
+        """Finish the current member"""
+        if self._zip:
+            self._member.close()
+            self._member = None
+            return
+        if self._member_written != self._member_size:
+            raise ValueError(
+                f"Member size changed while archiving: expected {self._member_size} "
+                f"bytes, got {self._member_written}"
+            )
+        # Tar members are padded to whole 512 byte blocks
+        self._emit(b"\0" * (-self._member_size % tarfile.BLOCKSIZE))
+
+    def close(self):
+        """Write the archive trailer"""
+        if self._zip:
+            self._zip.close()
+        else:
+            self._emit(b"\0" * (2 * tarfile.BLOCKSIZE))
+        if self._compressor:
+            self._pending += self._compressor.flush()
+
+    def read_pending(self):
+        """Take the archive bytes produced so far"""
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
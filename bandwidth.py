@@ -0,0 +1,225 @@
+import os
+import re
+import time
+import asyncio
+import requests
+
+# Priority classes and their relative share of a limited uplink
+PRIORITY_WEIGHTS = {"interactive": 8, "normal": 4, "bulk": 1}
+
+# Transfers up to this size are interactive, from this size on they are bulk
+INTERACTIVE_MAX_SIZE = 20 * 1024 * 1024
+BULK_MIN_SIZE = 1024 * 1024 * 1024
+
+# Attempts at reaching an rclone RC server, which may still be starting up
+RC_PUSH_ATTEMPTS = 3
+
+def parse_rate(text):
+    """Parse a rate like '512K', '10M' or 'off' into bytes per second (None = unlimited)"""
+    text = text.strip().upper()
+    if text in ("", "OFF", "0"):
+        return None
+    match = re.fullmatch(r"([\d.]+)\s*([BKMGT]?)(?:I?B)?(?:/S)?", text)
+    if not match:
+        raise ValueError(f"Invalid rate: {text}")
+    value, unit = match.groups()
+    multiplier = 1024 ** "BKMGT".index(unit) if unit else 1024
+    return int(float(value) * multiplier)
+
+def format_rate(rate):
+    """Format bytes per second in rclone's --bwlimit notation"""
+    if not rate:
+        return "off"
+    if rate >= 1024 * 1024:
+        return f"{rate / (1024 * 1024):.1f}M"
+    return f"{max(1, rate // 1024)}K"
+
+def parse_schedule(text):
+    """Parse a timetable like '08:00,512K 23:00,off' into sorted (minute, rate) pairs"""
+    schedule = []
+    for entry in text.split():
+        match = re.fullmatch(r"(\d{1,2}):(\d{2}),(.+)", entry)
+        if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+            raise ValueError(f"Invalid schedule entry: {entry}")
+        hours, minutes, rate = match.groups()
+        schedule.append((int(hours) * 60 + int(minutes), parse_rate(rate)))
+    return sorted(schedule)
+
+class TokenBucket:
+    """Token bucket that delays consumers to keep them under a rate"""
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.tokens = 0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.tokens = min(self.tokens, rate or 0)
+
+    async def consume(self, amount):
+        """Take amount tokens, sleeping off any deficit"""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        # Allow at most one second of burst
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+class BandwidthScheduler:
+    """
+    Share bandwidth between running transfer jobs.
+    Each active job gets a weighted share of the global limit according to
+    its priority class, capped by its class limit and its own limit. Python
+    transfer loops throttle through per-job token buckets; rclone children
+    get --bwlimit at start and are updated live through their RC server,
+    one push at a time per job and never while the child is stopped.
+    The global limit can follow a time-of-day schedule.
+    """
+    def __init__(self):
+        # A bad setting must not keep the bot or the batch CLI from starting
+        try:
+            self.base_rate = parse_rate(os.getenv('BWLIMIT', 'off'))
+        except ValueError as e:
+            print(f"Ignoring BWLIMIT: {e}")
+            self.base_rate = None
+        try:
+            self.schedule = parse_schedule(os.getenv('BWLIMIT_SCHEDULE', ''))
+        except ValueError as e:
+            print(f"Ignoring BWLIMIT_SCHEDULE: {e}")
+            self.schedule = []
+        self.class_limits = {priority: None for priority in PRIORITY_WEIGHTS}
+        self.jobs = {}
+        self.buckets = {}
+        self.rates = {}
+        self.pushed = {}
+        self.pushes = {}
+        self._watcher = None
+
+    def global_rate(self):
+        """Current global limit, taking the schedule into account"""
+        if not self.schedule:
+            return self.base_rate
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        # Before the first entry of the day the last entry of the previous day applies
+        rate = self.schedule[-1][1]
+        for start, scheduled_rate in self.schedule:
+            if start <= minute:
+                rate = scheduled_rate
+        return rate
+
+    def classify(self, size):
+        """Pick a priority class from the transfer size"""
+        if size and size <= INTERACTIVE_MAX_SIZE:
+            return "interactive"
+        if size and size >= BULK_MIN_SIZE:
+            return "bulk"
+        return "normal"
+
+    def register(self, job):
+        """Start scheduling a job"""
+        self.jobs[job.id] = job
+        self.buckets[job.id] = TokenBucket()
+        if not self._watcher or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch_schedule())
+        self.rebalance()
+
+    def unregister(self, job):
+        """Stop scheduling a finished job"""
+        self.jobs.pop(job.id, None)
+        self.buckets.pop(job.id, None)
+        self.rates.pop(job.id, None)
+        self.pushed.pop(job.id, None)
+        push = self.pushes.pop(job.id, None)
+        if push:
+            push.cancel()
+        self.rebalance()
+
+    def assign(self, job, size):
+        """Set a job's priority class once its size is known"""
+        job.priority = self.classify(size)
+        self.rebalance()
+
+    def rate_for(self, job):
+        """Rate currently allotted to a job (None = unlimited)"""
+        return self.rates.get(job.id)
+
+    def rebalance(self):
+        """Recompute every job's rate and push changes to rclone children"""
+        active = [job for job in self.jobs.values() if not job.paused]
+        global_rate = self.global_rate()
+        total_weight = sum(PRIORITY_WEIGHTS[job.priority] for job in active)
+        class_counts = {}
+        for job in active:
+            class_counts[job.priority] = class_counts.get(job.priority, 0) + 1
+
+        for job in self.jobs.values():
+            limits = [job.limit]
+            if job in active:
+                if global_rate:
+                    limits.append(global_rate * PRIORITY_WEIGHTS[job.priority] // total_weight)
+                if self.class_limits[job.priority]:
+                    limits.append(self.class_limits[job.priority] // class_counts[job.priority])
+            limits = [limit for limit in limits if limit]
+            rate = min(limits) if limits else None
+
+            if self.rates.get(job.id, "unset") != rate:
+                self.rates[job.id] = rate
+                self.buckets[job.id].set_rate(rate)
+            self.push(job)
+
+    def started(self, job, rate):
+        """Note the --bwlimit a job's rclone child was started with"""
+        self.pushed[job.id] = rate
+        self.push(job)
+
+    def push(self, job):
+        """Bring a job's running rclone child to its current rate"""
+        if not job.rc_url or job.stopped or self.pushed.get(job.id, "unset") == self.rates.get(job.id):
+            return
+        push = self.pushes.get(job.id)
+        # A running push picks up the newest rate before it ends
+        if not push or push.done():
+            self.pushes[job.id] = asyncio.create_task(self._push_rclone(job))
+
+    async def throttle(self, job, amount):
+        """Delay a job's transfer loop so it stays within its share"""
+        bucket = self.buckets.get(job.id)
+        if bucket and amount > 0:
+            await bucket.consume(amount)
+
+    async def _push_rclone(self, job):
+        """Change the limit of a running rclone process via core/bwlimit"""
+        attempts = 0
+        while job.id in self.jobs and job.rc_url and not job.stopped:
+            rate = self.rates.get(job.id)
+            if self.pushed.get(job.id, "unset") == rate:
+                return
+            try:
+                response = await asyncio.to_thread(
+                    requests.post, f"{job.rc_url}core/bwlimit", json={"rate": format_rate(rate)}, timeout=5
+                )
+                response.raise_for_status()
+                self.pushed[job.id] = rate
+            except requests.exceptions.RequestException as e:
+                # Left unpushed, the next rebalance or resume tries again
+                attempts += 1
+                if attempts >= RC_PUSH_ATTEMPTS:
+                    print(f"Error updating rclone bandwidth limit: {e}")
+                    return
+                await asyncio.sleep(1)
+
+    async def _watch_schedule(self):
+        """Re-evaluate the time-of-day schedule while jobs are running"""
+        current = self.global_rate()
+        while self.jobs:
+            await asyncio.sleep(30)
+            rate = self.global_rate()
+            if rate != current:
+                current = rate
+                self.rebalance()
+
+bandwidth = BandwidthScheduler()
@@ -0,0 +1,215 @@
+"""
+Headless batch runner for the transfer engine, no Telegram bot required.
+
+    python -m batch manifest.txt --config rclone.conf --jobs 4 [--json]
+
+Each manifest line is "<source> <remote:path>" where source is a URL or a
+local file, or a JSON object {"source": ..., "target": ...}. Blank lines and
+lines starting with # are ignored, duplicate entries run once, and with
+--state completed entries are recorded so a rerun resumes where it stopped.
+JSON entries sharing an "archive" name and target are packed on the fly
+into that archive (zip, tar or tar.zst by extension) while uploading.
+"""
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from contextlib import redirect_stdout
+from bandwidth import bandwidth, parse_rate
+from archive import format_for_name
+from transfer import (
+    ProgressSink, TransferJob, format_size, format_speed,
+    download_file_from_url, upload_to_rclone, url_source, file_source, archive_to_rclone
+)
+
+URL_PATTERN = re.compile(r'^(https?|ftp)://')
+
+class TerminalSink(ProgressSink):
+    """Print transfer progress as one line per update; size holds the bytes transferred"""
+    def __init__(self, label, out):
+        self.label = label
+        self.out = out
+        self.size = 0
+
+    def _print(self, text):
+        # Status texts are written for Telegram, flatten them to one line
+        text = ' '.join(text.replace('*', '').replace('`', '').split())
+        print(f"[{self.label}] {text}", file=self.out, flush=True)
+
+    async def status(self, text):
+        self._print(text)
+
+    async def progress(self, stage, name, current, total, speed, eta=None, target=None):
+        line = (
+            f"{stage} {name} {current * 100 / total:.1f}% "
+            f"{format_size(current)} / {format_size(total)} {format_speed(speed)}"
+        )
+        self._print(f"{line} ETA {eta}" if eta else line)
+
+    async def finish(self, ok, text):
+        self._print(text)
+
+class JsonSink(ProgressSink):
+    """Write transfer progress as JSON lines; size holds the bytes transferred"""
+    def __init__(self, label, out):
+        self.label = label
+        self.out = out
+        self.size = 0
+
+    def _emit(self, event, **fields):
+        record = {"entry": self.label, "event": event, "time": round(time.time(), 3), **fields}
+        print(json.dumps(record), file=self.out, flush=True)
+
+    async def status(self, text):
+        self._emit("status", text=text)
+
+    async def progress(self, stage, name, current, total, speed, eta=None, target=None):
+        self._emit(
+            "progress", stage=stage, name=name, current=current, total=total,
+            speed=round(speed), eta=eta, target=target
+        )
+
+    async def finish(self, ok, text):
+        self._emit("finish", ok=ok, text=text)
+
+def load_manifest(path):
+    """
+    Parse a manifest into unique transfer units.
+    Each unit is {"key", "sources", "target", "archive"}; plain entries have
+    a single source and no archive, archive entries are grouped per target.
+    """
+    units = {}
+    for number, line in enumerate(Path(path).read_text().splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        archive = None
+        if line.startswith('{'):
+            item = json.loads(line)
+            source, target = item.get("source", ""), item.get("target", "")
+            archive = item.get("archive")
+        else:
+            # Split on the last whitespace so local paths may contain spaces
+            source, target = (line.rsplit(None, 1) + [""])[:2]
+        if not source or ':' not in target:
+            raise ValueError(f"{path}:{number}: expected '<source> <remote:path>'")
+        key = (archive or source, target)
+        unit = units.setdefault(key, {"key": key, "sources": [], "target": target, "archive": archive})
+        if source not in unit["sources"]:
+            unit["sources"].append(source)
+    return list(units.values())
+
+def load_state(path):
+    """Load the set of completed (source, target) pairs"""
+    if not path or not Path(path).exists():
+        return set()
+    return {tuple(item) for item in json.loads(Path(path).read_text())}
+
+def save_state(path, completed):
+    """Record completed (source, target) pairs"""
+    if path:
+        Path(path).write_text(json.dumps(sorted(completed)))
+
+async def transfer_entry(entry, args, sink, job):
+    """Transfer one manifest unit, returns True on success and records its size in sink.size"""
+    remote, path = entry["target"].split(":", 1)
+    path = path.strip('/')
+
+    if entry["archive"]:
+        sources = [
+            url_source(source) if URL_PATTERN.match(source) else file_source(Path(source))
+            for source in entry["sources"]
+        ]
+        archive_size = await archive_to_rclone(
+            sources, entry["archive"], format_for_name(entry["archive"]),
+            remote, path, args.config, sink, job
+        )
+        sink.size = archive_size or 0
+        return bool(archive_size)
+
+    source = entry["sources"][0]
+    if URL_PATTERN.match(source):
+        download_path = await download_file_from_url(source, args.staging, sink, job)
+        if not download_path:
+            return False
+        sink.size = download_path.stat().st_size
+        return await upload_to_rclone(download_path, remote, path, args.config, sink, job)
+
+    local_path = Path(source)
+    if not local_path.is_file():
+        await sink.finish(False, f"❌ File not found: {source}")
+        return False
+    sink.size = local_path.stat().st_size
+    return await upload_to_rclone(local_path, remote, path, args.config, sink, job, cleanup=False)
+
+async def run_batch(entries, args, out):
+    completed = load_state(args.state)
+    semaphore = asyncio.Semaphore(args.jobs)
+    sink_class = JsonSink if args.json else TerminalSink
+    if args.bwlimit:
+        bandwidth.base_rate = args.bwlimit
+    results = {"ok": 0, "failed": 0, "skipped": 0}
+    transferred = 0
+
+    async def run_entry(number, entry):
+        nonlocal transferred
+        if entry["key"] in completed:
+            results["skipped"] += 1
+            return
+        sink = sink_class(str(number), out)
+        async with semaphore:
+            job = TransferJob("batch", limit=args.job_bwlimit)
+            ok = await job.start(transfer_entry(entry, args, sink, job), sink)
+        if ok:
+            results["ok"] += 1
+            transferred += sink.size
+            completed.add(entry["key"])
+            save_state(args.state, completed)
+        else:
+            results["failed"] += 1
+
+    start_time = time.time()
+    await asyncio.gather(*(run_entry(number, entry) for number, entry in enumerate(entries, 1)))
+    elapsed = time.time() - start_time
+
+    summary = dict(results, bytes=transferred, seconds=round(elapsed, 2))
+    if args.json:
+        print(json.dumps({"event": "summary", **summary}), file=out, flush=True)
+    else:
+        print(
+            f"Done in {elapsed:.1f}s: {results['ok']} ok, {results['failed']} failed, "
+            f"{results['skipped']} skipped, {format_size(transferred)} "
+            f"({format_speed(transferred / elapsed if elapsed else 0)})",
+            file=out, flush=True
+        )
+    return 1 if results["failed"] else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m batch",
+        description="Transfer a manifest of URLs and files to rclone remotes without the bot"
+    )
+    parser.add_argument("manifest", help="manifest file with '<source> <remote:path>' lines")
+    parser.add_argument("--config", help="rclone config file (default: rclone's own)")
+    parser.add_argument("--jobs", type=int, default=3, help="concurrent transfers (default: 3)")
+    parser.add_argument("--staging", default="downloads/batch", help="download folder for URL sources")
+    parser.add_argument("--state", help="file recording completed entries so reruns skip them")
+    parser.add_argument("--bwlimit", type=parse_rate, help="global bandwidth limit, e.g. 10M")
+    parser.add_argument("--job-bwlimit", type=parse_rate, help="bandwidth limit per transfer")
+    parser.add_argument("--json", action="store_true", help="write progress as JSON lines")
+    args = parser.parse_args(argv)
+    try:
+        entries = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    # Keep stdout clean for progress output; engine diagnostics go to stderr
+    out = sys.stdout
+    with redirect_stdout(sys.stderr):
+        return asyncio.run(run_batch(entries, args, out))
+
+if __name__ == "__main__":
+    sys.exit(main())
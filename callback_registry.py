@@ -0,0 +1,46 @@
+import secrets
+from collections import OrderedDict
+
+class CallbackRegistry:
+    """
+    Map short opaque tokens to full (remote, path) locations.
+    Telegram limits callback data to 64 bytes, so buttons carry a token
+    and the real location stays server-side, keyed per user session.
+    """
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.sessions = {}
+
+    def register(self, user_id, remote, path):
+        """Return the token for a location, creating one if needed"""
+        session = self.sessions.setdefault(user_id, {"tokens": OrderedDict(), "locations": {}})
+        location = (remote, path)
+        
+        token = session["locations"].get(location)
+        if token:
+            session["tokens"].move_to_end(token)
+            return token
+        
+        token = secrets.token_urlsafe(6)
+        while token in session["tokens"]:
+            token = secrets.token_urlsafe(6)
+        session["tokens"][token] = location
+        session["locations"][location] = token
+        
+        # Evict least recently used entries once the session grows too large
+        while len(session["tokens"]) > self.max_entries:
+            _, old_location = session["tokens"].popitem(last=False)
+            del session["locations"][old_location]
+        return token
+
+    def resolve(self, user_id, token):
+        """Return the (remote, path) for a token, or None if unknown/evicted"""
+        session = self.sessions.get(user_id)
+        if not session or token not in session["tokens"]:
+            return None
+        session["tokens"].move_to_end(token)
+        return session["tokens"][token]
+
+    def clear(self, user_id):
+        """Drop all tokens of a user's session"""
+        self.sessions.pop(user_id, None)
@@ -0,0 +1,201 @@
+import os
+import time
+import gzip
+import heapq
+import json
+import shutil
+import asyncio
+from pathlib import Path
+from rclone_runner import rclone
+
+class DirectoryIndex:
+    """
+    Local index of each remote's directory tree for instant folder search.
+    Built in the background with `rclone lsjson -R --dirs-only`, kept fresh by
+    merging navigation listings, and stored as gzipped path lists on disk.
+    """
+    def __init__(self, max_age=6 * 60 * 60, build_timeout=30 * 60):
+        self.max_age = max_age
+        self.build_timeout = build_timeout
+        self.trees = {}
+        self.tasks = {}
+
+    def _index_path(self, user_id, remote):
+        """Get index file path for a user's remote"""
+        return Path("config") / str(user_id) / "index" / f"{remote}.gz"
+
+    def _load(self, user_id, remote):
+        """Load a remote's index from memory or disk"""
+        key = (user_id, remote)
+        if key not in self.trees:
+            index_path = self._index_path(user_id, remote)
+            if not index_path.exists():
+                return None
+            try:
+                with gzip.open(index_path, 'rt', encoding='utf-8') as f:
+                    built = float(f.readline().split()[-1])
+                    dirs = {line.rstrip('\n') for line in f if line.strip()}
+                self.trees[key] = {"built": built, "dirs": dirs}
+            except (OSError, ValueError, IndexError) as e:
+                print(f"Error loading index {index_path}: {e}")
+                return None
+        return self.trees[key]
+
+    def _save(self, user_id, remote):
+        """Write a remote's index to disk"""
+        tree = self.trees[(user_id, remote)]
+        index_path = self._index_path(user_id, remote)
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = index_path.parent / f"{index_path.name}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            f.write(f"#built {tree['built']}\n")
+            f.write('\n'.join(sorted(tree["dirs"])))
+        os.replace(temp_path, index_path)
+
+    def is_building(self, user_id):
+        """Check whether any index of a user is being built"""
+        return any(
+            not task.done() for (owner, _), task in self.tasks.items() if owner == user_id
+        )
+
+    def refresh(self, user_id, remotes, force=False):
+        """Schedule background rebuilds for stale or missing indexes"""
+        for remote in remotes:
+            key = (user_id, remote)
+            task = self.tasks.get(key)
+            if task and not task.done():
+                continue
+            tree = self._load(user_id, remote)
+            if not force and tree and time.time() - tree["built"] < self.max_age:
+                continue
+            self.tasks[key] = asyncio.create_task(self._build(user_id, remote))
+
+    async def _build(self, user_id, remote):
+        """List a remote's full directory tree and store it"""
+        config_path = Path("config") / str(user_id) / "rclone.conf"
+        try:
+            returncode, stdout, stderr = await rclone.run(
+                ['lsjson', f"{remote}:", '-R', '--dirs-only', '--fast-list'],
+                config_path=config_path, remote=remote, timeout=self.build_timeout, pool="index"
+            )
+            if returncode != 0:
+                print(f"Error indexing {remote}: {stderr.strip()[-500:]}")
+                return
+            
+            entries = json.loads(stdout or "[]")
+            self.trees[(user_id, remote)] = {
+                "built": time.time(),
+                "dirs": {e["Path"] for e in entries if "\n" not in e["Path"]}
+            }
+            self._save(user_id, remote)
+        except Exception as e:
+            print(f"Error indexing {remote}: {e}")
+
+    def update(self, user_id, remote, path, dirs):
+        """Merge a fresh listing of one directory into the index"""
+        tree = self._load(user_id, remote)
+        if not tree:
+            return
+        
+        prefix = f"{path}/" if path else ""
+        children = {prefix + d for d in dirs}
+        current = {
+            d for d in tree["dirs"]
+            if d.startswith(prefix) and '/' not in d[len(prefix):]
+        }
+        if current == children:
+            return
+        
+        # Drop removed folders together with everything below them
+        removed = current - children
+        tree["dirs"] = {
+            d for d in tree["dirs"]
+            if not any(d == r or d.startswith(f"{r}/") for r in removed)
+        } | children
+        try:
+            self._save(user_id, remote)
+        except OSError as e:
+            print(f"Error saving index for {remote}: {e}")
+
+    def search(self, user_id, query, remotes, limit=20):
+        """Find folders whose name or path contains the query"""
+        query = query.lower().strip()
+        matches = []
+        for remote in remotes:
+            tree = self._load(user_id, remote)
+            if not tree:
+                continue
+            for d in tree["dirs"]:
+                name = d.rsplit('/', 1)[-1].lower()
+                if query in name:
+                    rank = 0 if name == query else 1 if name.startswith(query) else 2
+                elif query in d.lower():
+                    rank = 3
+                else:
+                    continue
+                matches.append((rank, len(d), remote, d))
+        return [(remote, d) for _, _, remote, d in heapq.nsmallest(limit, matches)]
+
+    def invalidate(self, user_id):
+        """Forget all indexes of a user, e.g. after a config change"""
+        # Cancel running builds so they can't write an outdated index back
+        for key in [key for key in self.tasks if key[0] == user_id]:
+            self.tasks.pop(key).cancel()
+        for key in [key for key in self.trees if key[0] == user_id]:
+            del self.trees[key]
+        shutil.rmtree(Path("config") / str(user_id) / "index", ignore_errors=True)
+
+class DestinationHistory:
+    """Recently and frequently used upload destinations per user"""
+    def __init__(self, max_entries=50):
+        self.max_entries = max_entries
+        self.entries = {}
+
+    def _history_path(self, user_id):
+        """Get destination history file path for a user"""
+        return Path("config") / str(user_id) / "destinations.json"
+
+    def _load(self, user_id):
+        """Load a user's destination history"""
+        if user_id not in self.entries:
+            try:
+                self.entries[user_id] = json.loads(self._history_path(user_id).read_text())
+            except (OSError, ValueError):
+                self.entries[user_id] = []
+        return self.entries[user_id]
+
+    def record(self, user_id, remote, path):
+        """Record an upload to a destination"""
+        entries = self._load(user_id)
+        for entry in entries:
+            if entry["remote"] == remote and entry["path"] == path:
+                entry["count"] += 1
+                entry["last_used"] = time.time()
+                break
+        else:
+            entries.append({"remote": remote, "path": path, "count": 1, "last_used": time.time()})
+        
+        entries.sort(key=lambda e: e["last_used"], reverse=True)
+        del entries[self.max_entries:]
+        try:
+            history_path = self._history_path(user_id)
+            history_path.parent.mkdir(parents=True, exist_ok=True)
+            history_path.write_text(json.dumps(entries))
+        except OSError as e:
+            print(f"Error saving destination history: {e}")
+
+    def suggestions(self, user_id, limit=3):
+        """Return most recent and most frequent destinations as (remote, path)"""
+        entries = self._load(user_id)
+        recent = sorted(entries, key=lambda e: e["last_used"], reverse=True)[:limit]
+        frequent = sorted(entries, key=lambda e: e["count"], reverse=True)[:limit]
+        
+        locations = []
+        for entry in recent + frequent:
+            location = (entry["remote"], entry["path"])
+            if location not in locations:
+                locations.append(location)
+        return locations
+
+directory_index = DirectoryIndex()
+destination_history = DestinationHistory()
@@ -1,32 +1,38 @@
-from pyrogram import Client, filters, enums
+from pyrogram import Client, filters, enums, idle
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 import os
-import subprocess
-import requests
 from pathlib import Path
-import shutil
 import re
-import hashlib
-import base64
 import time
 import asyncio
-import re
+import json
 from functools import wraps
 from webserver import keep_alive
+from rclone_runner import rclone
+from rclone_config import rclone_configs
+from callback_registry import CallbackRegistry
+from directory_index import directory_index, destination_history
+from bandwidth import bandwidth, parse_rate, parse_schedule, format_rate
+from transfer import (
+    ProgressSink, TransferJob, transfer_jobs, format_size, format_speed, create_progress_bar,
+    download_file_from_url, upload_to_rclone, url_source, archive_to_rclone, http_session
+)
+from archive import available_formats, archive_name
+from mirror import MirrorWatcher, parse_interval, format_interval
 
 # Get owner ID from environment variable
 OWNER_ID = os.getenv('OWNER_ID')
 
 def owner_only(func):
     @wraps(func)
-    def wrapped(client, message, *args, **kwargs):
+    async def wrapped(client, message, *args, **kwargs):
         if not OWNER_ID:
-            message.reply_text("Owner ID not configured. Please set OWNER_ID environment variable.")
+            await message.reply_text("Owner ID not configured. Please set OWNER_ID environment variable.")
             return
         if str(message.from_user.id) != str(OWNER_ID):
-            message.reply_text("This command is only available to the bot owner.")
+            await message.reply_text("This command is only available to the bot owner.")
             return
-        return func(client, message, *args, **kwargs)
+        return await func(client, message, *args, **kwargs)
     return wrapped
 
 # ====================================================
@@ -38,79 +44,119 @@ bot_token = os.getenv('BOT_TOKEN')
 
 app = Client("rclone_bot", api_id, api_hash, bot_token=bot_token)
 
-# Create necessary directories
-Path("downloads").mkdir(exist_ok=True)
-Path("config").mkdir(exist_ok=True)
-
 # User states tracking
 user_states = {}
 
+def format_location(remote, path, width=40):
+    """Format a remote location for button labels, keeping the deepest part"""
+    location = f"{remote}:{path}"
+    return location if len(location) <= width else "..." + location[-(width - 3):]
+
 # ========== Rclone Operations ==========
 class RcloneNavigator:
-    def __init__(self):
+    def __init__(self, registry=None):
         self.user_states = {}
+        self.registry = registry or CallbackRegistry()
         self.ITEMS_PER_PAGE = 10
         
     def _get_config_path(self, user_id):
         """Get rclone config path for a user"""
         return Path("config") / str(user_id) / "rclone.conf"
         
-    def get_rclone_remotes(self, user_id):
+    async def get_rclone_remotes(self, user_id):
         """Get list of rclone remotes for a user"""
+        config = rclone_configs.get(self._get_config_path(user_id))
+        if config and not config.encrypted:
+            return config.remote_names()
+        
+        # Encrypted or unparsable configs need rclone itself
         try:
-            result = subprocess.run(
-                ['rclone', 'listremotes', '--config', str(self._get_config_path(user_id))],
-                capture_output=True, text=True, check=True
+            returncode, stdout, stderr = await rclone.run(
+                ['listremotes'], config_path=self._get_config_path(user_id), pool="list"
             )
-            return [remote.strip() for remote in result.stdout.split('\n') if remote.strip()]
-        except subprocess.CalledProcessError as e:
-            print(f"Error getting remotes: {e}")
+        except asyncio.TimeoutError:
+            print("Error getting remotes: rclone timed out")
             return []
+        if returncode != 0:
+            print(f"Error getting remotes: {stderr.strip()}")
+            return []
+        return [remote.strip().rstrip(':') for remote in stdout.split('\n') if remote.strip()]
 
-    def list_rclone_dirs(self, user_id, remote, path):
-        """List directories in a remote path"""
-        # Remove file extensions and clean path
-        if '.' in path:
-            path = '/'.join(path.split('/')[:-1])
+    async def list_rclone_dirs(self, user_id, remote, path):
+        """
+        List directories in a remote path.
+        Returns None if listing failed, so callers can tell it from a folder without subfolders.
+        """
+        full_path = f"{remote}:{path.strip('/')}" if path and path.strip() else f"{remote}:"
         
+        try:
+            returncode, stdout, stderr = await rclone.run(
+                ['lsf', full_path, '--dirs-only'],
+                config_path=self._get_config_path(user_id), remote=remote, pool="list"
+            )
+        except asyncio.TimeoutError:
+            print(f"Error listing directories: rclone timed out on {full_path}")
+            return None
+        if returncode != 0:
+            print(f"Error listing directories: exit code {returncode}\nCommand failed with output: {stderr}")
+            return None
+        return [d.strip('/') for d in stdout.split('\n') if d.strip()]
+
+    async def list_rclone_files(self, user_id, remote, path, timeout=30 * 60):
+        """
+        List all files below a remote path with size, modtime and hashes.
+        Returns None if listing failed, so callers can tell it from an empty folder.
+        """
         full_path = f"{remote}:{path.strip('/')}" if path and path.strip() else f"{remote}:"
+        args = ['lsjson', full_path, '-R', '--files-only']
+        # Only ask for hashes the backend stores, others would be computed by reading every file
+        config = rclone_configs.get(self._get_config_path(user_id))
+        if config and config.capabilities(remote)["stored_hashes"]:
+            args.append('--hash')
         
         try:
-            result = subprocess.run(
-                ['rclone', 'lsf', '--config', str(self._get_config_path(user_id)), 
-                 full_path, '--dirs-only'],
-                capture_output=True, text=True, check=True
+            returncode, stdout, stderr = await rclone.run(
+                args, config_path=self._get_config_path(user_id), remote=remote, timeout=timeout,
+                pool="index"
             )
-            return [d.strip('/') for d in result.stdout.split('\n') if d.strip()]
-        except subprocess.CalledProcessError as e:
-            print(f"Error listing directories: {e}\nCommand failed with output: {e.stderr}")
-            return []
+            if returncode != 0:
+                print(f"Error listing files: exit code {returncode}\nCommand failed with output: {stderr}")
+                return None
+            return json.loads(stdout or "[]")
+        except asyncio.TimeoutError:
+            print(f"Error listing files: rclone timed out on {full_path}")
+        except ValueError as e:
+            print(f"Error listing files: invalid rclone output for {full_path}: {e}")
+        return None
 
-    def _sanitize_text(self, text):
-        """Sanitize text by replacing problematic characters"""
-        text = re.sub(r'[^\w/]', '_', text)
-        return re.sub(r'_+', '_', text)
+    def encode_path(self, user_id, remote, path):
+        """Register a location and return the token used in callback data"""
+        return self.registry.register(user_id, remote, path)
 
-    def encode_path(self, remote, path):
-        """Encode path to fit within Telegram's callback data limit"""
-        remote = self._sanitize_text(remote)
-        path = self._sanitize_text(path)
-        
-        combined = f"{remote}:{path}"
-        if len(combined) <= 40:  # Conservative limit
-            return combined
-            
-        # Create shortened version with hash for longer paths
-        path_hash = base64.urlsafe_b64encode(hashlib.md5(path.encode()).digest())[:6].decode()
-        path_parts = path.split('/')
-        shortened_path = f".../{self._sanitize_text(path_parts[-1])[:10]}" if len(path_parts) > 1 else self._sanitize_text(path_parts[0][:10])
-        return f"{remote}:{shortened_path}#{path_hash}"
+    def decode_path(self, user_id, token):
+        """Resolve callback data token back to its (remote, path) location"""
+        return self.registry.resolve(user_id, token)
 
-    def decode_path(self, encoded_path):
-        """Decode the path from callback data"""
-        return encoded_path.split('#')[0] if '#' in encoded_path else encoded_path
+    def build_remote_keyboard(self, user_id, remotes):
+        """Build remote selection keyboard with recent destinations on top"""
+        keyboard = [
+            [InlineKeyboardButton(
+                f"⭐ {format_location(remote, path)}",
+                callback_data=f"sel_{self.encode_path(user_id, remote, path)}"
+            )]
+            for remote, path in destination_history.suggestions(user_id)
+            if remote in remotes
+        ]
+        keyboard.extend(
+            [InlineKeyboardButton(
+                f"🌐 {remote[:15]}..." if len(remote) > 15 else f"🌐 {remote}",
+                callback_data=f"nav_{self.encode_path(user_id, remote, '')}"
+            ) for remote in remotes[i:i+2]]
+            for i in range(0, len(remotes), 2)
+        )
+        return InlineKeyboardMarkup(keyboard)
 
-    async def build_navigation_keyboard(self, dirs, current_page, remote, path):
+    async def build_navigation_keyboard(self, user_id, dirs, current_page, remote, path):
         """Build navigation keyboard with pagination"""
         total_items = len(dirs)
         total_pages = (total_items + self.ITEMS_PER_PAGE - 1) // self.ITEMS_PER_PAGE
@@ -122,14 +168,11 @@ class RcloneNavigator:
         for i in range(0, len(paged_dirs), 2):
             row = []
             for d in paged_dirs[i:i+2]:
-                new_path = os.path.join(path, d)
-                encoded = self.encode_path(remote, new_path)
-                if len(encoded) > 64:  # Telegram's limit
-                    encoded = encoded[:60] + "_TRNC"
+                new_path = f"{path}/{d}" if path else d
                 row.append(
                     InlineKeyboardButton(
                         f"📁 {d[:15]}..." if len(d) > 15 else f"📁 {d}",
-                        callback_data=f"nav_{encoded}"
+                        callback_data=f"nav_{self.encode_path(user_id, remote, new_path)}"
                     )
                 )
             grid.append(row)
@@ -145,9 +188,10 @@ class RcloneNavigator:
             grid.append(nav_row)
         
         # Add control buttons
+        parent_path = '/'.join(path.split('/')[:-1])
         grid.extend([
-            [InlineKeyboardButton("✅ Select This Folder", callback_data=f"sel_{remote}:{path}")],
-            [InlineKeyboardButton("🔙 Back", callback_data=f"nav_{remote}:{'/'.join([p for p in path.split('/')[:-1] if p])}") 
+            [InlineKeyboardButton("✅ Select This Folder", callback_data=f"sel_{self.encode_path(user_id, remote, path)}")],
+            [InlineKeyboardButton("🔙 Back", callback_data=f"nav_{self.encode_path(user_id, remote, parent_path)}") 
              if path else InlineKeyboardButton("🔙 Back to Remotes", callback_data="nav_root")],
             [InlineKeyboardButton("❌ Cancel Upload", callback_data="cancel_upload")]
         ])
@@ -156,478 +200,248 @@ class RcloneNavigator:
 
     async def show_remote_selection(self, client, callback_query, user_id):
         """Show remote selection menu"""
-        remotes = self.get_rclone_remotes(user_id)
-        keyboard = [
-            [InlineKeyboardButton(
-                f"🌐 {remote[:15]}..." if len(remote) > 15 else f"🌐 {remote}",
-                callback_data=f"nav_{remote}:"
-            ) for remote in remotes[i:i+2]]
-            for i in range(0, len(remotes), 2)
-        ]
-        await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(keyboard))
+        remotes = await self.get_rclone_remotes(user_id)
+        await callback_query.message.edit_reply_markup(self.build_remote_keyboard(user_id, remotes))
 
     async def list_path(self, client, callback_query, user_id, remote, path):
-        """Generate directory listing with navigation"""
-        # Prevent navigation to file paths
-        if any(path.lower().endswith(ext) for ext in ['.mp4', '.mkv', '.avi', '.mov', '.txt', '.pdf']):
-            await callback_query.answer("⚠️ Cannot navigate to file paths", show_alert=True)
-            return
-        
-        path = path.replace(':', '').strip('/')
-        dirs = self.list_rclone_dirs(user_id, remote, path)
-        current_page = self.user_states.setdefault(user_id, {}).get("nav_page", 0)
+        """Generate directory listing with navigation, returns False if it failed and was reported"""
+        path = path.strip('/')
+        dirs = await self.list_rclone_dirs(user_id, remote, path)
+        if dirs is None:
+            await callback_query.answer(f"❌ Could not list {format_location(remote, path)}", show_alert=True)
+            return False
+        directory_index.update(user_id, remote, path, dirs)
+        state = self.user_states.setdefault(user_id, {})
+        state["location"] = (remote, path)
+        current_page = state.get("nav_page", 0)
         
         try:
-            keyboard = await self.build_navigation_keyboard(dirs, current_page, remote, path)
+            keyboard = await self.build_navigation_keyboard(user_id, dirs, current_page, remote, path)
             await callback_query.message.edit_reply_markup(keyboard)
+            return True
         except Exception as e:
             error_msg = f"Error updating navigation: {str(e)}"
             print(error_msg)
             await callback_query.answer(error_msg[:200], show_alert=True)
+            return False
 
-            
-# ========== File Transfer Utilities ==========
-def format_size(size):
-    """Convert bytes to human readable format"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size < 1024:
-            return f"{size:.1f} {unit}"
-        size /= 1024
-    return f"{size:.1f} GB"
-
-def format_speed(bytes_per_second):
-    """Convert bytes per second to human readable format"""
-    speed = bytes_per_second
-    for unit in ['B/s', 'KB/s', 'MB/s', 'GB/s']:
-        if speed < 1024:
-            return f"{speed:.1f} {unit}"
-        speed /= 1024
-    return f"{speed:.1f} GB/s"
-
-def create_progress_bar(percent, width=20):
-    """Create a visual progress bar"""
-    filled = int(width * percent / 100)
-    bar = '█' * filled + '░' * (width - filled)
-    return bar
-
-# Helper function to convert units to bytes for consistent tracking
-def convert_to_bytes(value, unit):
-    """Convert a value with unit to bytes"""
-    multiplier = 1
-    unit = unit.strip().upper()
-    
-    if unit.startswith('K'):
-        multiplier = 1024
-    elif unit.startswith('M'):
-        multiplier = 1024 * 1024
-    elif unit.startswith('G'):
-        multiplier = 1024 * 1024 * 1024
-    elif unit.startswith('T'):
-        multiplier = 1024 * 1024 * 1024 * 1024
-    
-    return int(value * multiplier)
-
-async def download_telegram_file(message, user_id, status_message):
-    """Download a file from Telegram message with progress tracking"""
-    try:
-        # Setup download directory
-        download_dir = Path("downloads") / str(user_id)
-        download_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Get file information
-        if message.document:
-            file = message.document
-            file_name = file.file_name
-        elif message.video:
-            file = message.video
-            file_name = file.file_name or f"video_{file.file_id}.mp4"
-        elif message.audio:
-            file = message.audio
-            file_name = file.file_name or f"audio_{file.file_id}.mp3"
-        elif message.photo:
-            file = message.photo[-1]  # Get highest resolution
-            file_name = f"photo_{file.file_id}.jpg"
-        else:
-            await status_message.edit_text("❌ Unsupported file type")
-            return None
-        
-        # Clean filename
-        file_name = re.sub(r'[\\/*?:"<>|]', "_", file_name)
-        download_path = download_dir / file_name
-        
-        # Start download with progress tracking
-        start_time = time.time()
-        last_update_time = start_time
-        last_downloaded = 0
+navigator = RcloneNavigator()
+
+# ========== Telegram Progress ==========
+def job_controls(job):
+    """Build the pause/resume and cancel keyboard for a transfer's status message"""
+    toggle = (
+        InlineKeyboardButton("▶️ Resume", callback_data=f"job_resume_{job.id}") if job.paused
+        else InlineKeyboardButton("⏸ Pause", callback_data=f"job_pause_{job.id}")
+    )
+    return InlineKeyboardMarkup([[toggle, InlineKeyboardButton("❌ Cancel", callback_data=f"job_cancel_{job.id}")]])
+
+class TelegramSink(ProgressSink):
+    """Report transfer progress by editing a Telegram status message"""
+    def __init__(self, status_message, job=None):
+        self.status_message = status_message
+        self.job = job
+
+    async def _edit(self, text, reply_markup=None):
+        try:
+            await self.status_message.edit_text(text, reply_markup=reply_markup)
+        except Exception as e:
+            print(f"Error updating status: {e}")
+
+    async def status(self, text):
+        await self._edit(text, job_controls(self.job) if self.job else None)
+
+    async def finish(self, ok, text):
+        await self._edit(text)
+
+    async def progress(self, stage, name, current, total, speed, eta=None, target=None):
+        percent = (current * 100) / total
+        progress_bar = create_progress_bar(percent)
         
-        async def progress_callback(current, total):
-            nonlocal last_update_time, last_downloaded
-            
-            current_time = time.time()
-            if current_time - last_update_time < 0.5:
-                return
-            
-            # Calculate speed and progress
-            time_diff = current_time - last_update_time
-            bytes_per_second = (current - last_downloaded) / time_diff
-            speed = format_speed(bytes_per_second)
-            
-            percent = (current * 100) / total
-            progress_bar = create_progress_bar(percent)
-            downloaded_size = format_size(current)
-            total_size_str = format_size(total)
-            
+        if stage == "download":
             # Truncate filename if too long
-            display_filename = file_name[:30] + "..." if len(file_name) > 30 else file_name
-            
+            display_filename = name[:30] + "..." if len(name) > 30 else name
             status_text = (
                 f"📁 {display_filename}\n"
                 f"⬇️ Downloading: {percent:.1f}%\n"
                 f"{progress_bar}\n"
-                f"{downloaded_size} / {total_size_str}\n"
-                f"🚀 Speed: {speed}"
+                f"{format_size(current)} / {format_size(total)}\n"
+                f"🚀 Speed: {format_speed(speed)}"
             )
-            
-            try:
-                await status_message.edit_text(status_text)
-            except Exception as e:
-                print(f"Error updating status: {e}")
-            
-            last_update_time = current_time
-            last_downloaded = current
+        elif target == "Telegram":
+            status_text = (
+                f"📤 Uploading to Telegram\n"
+                f"⬆️ Progress: {percent:.1f}%\n"
+                f"{progress_bar}\n"
+                f"{format_size(current)} / {format_size(total)}\n"
+                f"🚀 Speed: {format_speed(speed)}"
+            )
+        else:
+            status_text = (
+                f"📤 Uploading to {target}\n"
+                f"📄 File: {name}\n"
+                f"{progress_bar} {percent:.1f}%\n"
+                f"⚡ Speed: {format_speed(speed)}\n"
+                f"📦 Progress: {format_size(current)} / {format_size(total)}\n"
+                f"⏳ ETA: {eta}"
+            )
+        await self.status(status_text)
+
+def get_media_file(message):
+    """Get the media object and a file name for a Telegram message"""
+    if message.document:
+        file = message.document
+        file_name = file.file_name
+    elif message.video:
+        file = message.video
+        file_name = file.file_name or f"video_{file.file_id}.mp4"
+    elif message.audio:
+        file = message.audio
+        file_name = file.file_name or f"audio_{file.file_id}.mp3"
+    elif message.photo:
+        file = message.photo[-1]  # Get highest resolution
+        file_name = f"photo_{file.file_id}.jpg"
+    else:
+        return None, None
+    # Clean filename
+    return file, re.sub(r'[\\/*?:"<>|]', "_", file_name)
+
+def telegram_source(client, message):
+    """Archive source streaming a Telegram file without saving it"""
+    async def open_source():
+        file, file_name = get_media_file(message)
+        if not file:
+            raise ValueError("Unsupported file type")
+        return file_name, file.file_size, client.stream_media(message)
+    return open_source
+
+def progress_tracker(sink, stage, name, job=None, target=None):
+    """Build a Pyrogram progress callback that reports to a sink every 0.5 seconds"""
+    last_update_time = time.time()
+    last_current = 0
+    
+    async def progress_callback(current, total):
+        nonlocal last_update_time, last_current
+        if job:
+            await job.progress_checkpoint(current, total)
         
-        # Download the file
-        await message.download(
-            file_name=str(download_path),
-            progress=progress_callback
-        )
+        current_time = time.time()
+        if current_time - last_update_time < 0.5:
+            return
         
-        await status_message.edit_text(f"✅ Download completed: {file_name}\nStarting upload...")
-        return download_path
+        # Calculate speed since the last update
+        bytes_per_second = (current - last_current) / (current_time - last_update_time)
+        await sink.progress(stage, name, current, total, bytes_per_second, target=target)
+        
+        last_update_time = current_time
+        last_current = current
     
-    except Exception as e:
-        await status_message.edit_text(f"❌ Download failed: {str(e)[:1000]}")
-        if download_dir.exists():
-            shutil.rmtree(download_dir)
-        return None
+    return progress_callback
 
-async def download_file_from_url(url, user_id, status_message):
-    """
-    Download a file from URL with visual progress bar tracking
-    Returns path of downloaded file if successful, None if failed
-    """
+async def download_telegram_file(message, user_id, sink, job=None):
+    """Download a file from Telegram message with progress tracking"""
+    download_path = None
     try:
-        # Setup download directory
+        # Setup download directory, one per job so equally named files of concurrent transfers don't collide
         download_dir = Path("downloads") / str(user_id)
+        if job:
+            download_dir = job.staging_dir(download_dir)
         download_dir.mkdir(parents=True, exist_ok=True)
         
-        # Improved filename extraction with content-disposition header
-        response = requests.head(url)
-        if 'Content-Disposition' in response.headers:
-            # Try to get filename from content-disposition header
-            cd = response.headers['Content-Disposition']
-            filename_match = re.search(r'filename="?([^"]+)"?', cd)
-            if filename_match:
-                file_name = filename_match.group(1)
-            else:
-                file_name = url.split("/")[-1].split("?")[0]
-        else:
-            # Fallback to URL-based extraction
-            file_name = url.split("/")[-1].split("?")[0]
-        
-        # Clean filename of any invalid characters
-        file_name = re.sub(r'[\\/*?:"<>|]', "_", file_name)
-        
-        # If filename is still problematic, generate a random one with extension
-        if not file_name or file_name == "" or len(file_name) < 3:
-            import uuid
-            extension = url.split(".")[-1] if "." in url.split("/")[-1] else "bin"
-            if extension.find("?") > 0:
-                extension = extension.split("?")[0]
-            file_name = f"download_{uuid.uuid4().hex}.{extension}"
+        # Get file information
+        file, file_name = get_media_file(message)
+        if not file:
+            await sink.finish(False, "❌ Unsupported file type")
+            return None
         
         download_path = download_dir / file_name
+        if job:
+            job.track(download_path, download_dir / f"{file_name}.temp")
+            bandwidth.assign(job, file.file_size)
         
-        # Start download with progress tracking
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(download_path, 'wb') as f:
-            downloaded = 0
-            last_update_time = time.time()
-            last_downloaded = 0
-            
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    
-                    # Update progress every 0.5 seconds
-                    current_time = time.time()
-                    time_diff = current_time - last_update_time
-                    
-                    if time_diff >= 0.5:
-                        if total_size:
-                            # Calculate speed
-                            bytes_per_second = (downloaded - last_downloaded) / time_diff
-                            speed = format_speed(bytes_per_second)
-                            
-                            # Calculate progress
-                            percent = (downloaded * 100) / total_size
-                            progress_bar = create_progress_bar(percent)
-                            downloaded_size = format_size(downloaded)
-                            total_size_str = format_size(total_size)
-                            
-                            # Truncate filename if too long
-                            display_filename = file_name[:30] + "..." if len(file_name) > 30 else file_name
-                            
-                            status_text = (
-                                f"📁 {display_filename}\n"
-                                f"⬇️ Downloading: {percent:.1f}%\n"
-                                f"{progress_bar}\n"
-                                f"{downloaded_size} / {total_size_str}\n"
-                                f"🚀 Speed: {speed}"
-                            )
-                            await status_message.edit_text(status_text)
-                            
-                            # Update tracking variables
-                            last_update_time = current_time
-                            last_downloaded = downloaded
+        # Download the file
+        await message.download(
+            file_name=str(download_path),
+            progress=progress_tracker(sink, "download", file_name, job)
+        )
         
-        await status_message.edit_text(f"✅ Download completed: {file_name}\nStarting upload...")
+        await sink.status(f"✅ Download completed: {file_name}\nStarting upload...")
         return download_path
     
     except Exception as e:
-        await status_message.edit_text(f"❌ Download failed: {str(e)[:1000]}")
-        if download_dir.exists():
-            shutil.rmtree(download_dir)
+        await sink.finish(False, f"❌ Download failed: {str(e)[:1000]}")
+        # Remove just the partial file, other transfers may share the folder
+        if download_path and download_path.exists():
+            download_path.unlink()
         return None
 
+async def send_to_telegram(client, chat_id, file_path, sink, job=None,
+                           caption="📤 Here's your uploaded file", file_name=None):
+    """Upload a local file to a Telegram chat, returns the sent message"""
+    if job:
+        bandwidth.assign(job, file_path.stat().st_size)
+    name = file_name or file_path.name
+    return await client.send_document(
+        chat_id=chat_id,
+        document=str(file_path),
+        file_name=name,
+        progress=progress_tracker(sink, "upload", name, job, target="Telegram"),
+        caption=caption
+    )
 
-async def upload_to_telegram(client, original_message, status_message):
+async def upload_to_telegram(client, original_message, sink, job=None):
     """Handle file upload to Telegram with progress tracking"""
     try:
         user_id = original_message.from_user.id
+        download_dir = Path("downloads") / str(user_id)
         
         # For URL downloads, first download the file
         if original_message.text:
-            temp_status = await status_message.edit_text("⏳ Downloading from URL...")
-            download_path = await download_file_from_url(original_message.text, user_id, temp_status)
+            await sink.status("⏳ Downloading from URL...")
+            download_path = await download_file_from_url(original_message.text, download_dir, sink, job)
             if not download_path:
                 return
             file_path = Path(download_path)
         else:
             # For Telegram files, download to temp location
-            temp_status = await status_message.edit_text("⏳ Processing file...")
-            download_dir = Path("downloads") / str(user_id)
+            await sink.status("⏳ Processing file...")
+            if job:
+                download_dir = job.staging_dir(download_dir)
             download_dir.mkdir(parents=True, exist_ok=True)
             
-            if original_message.document:
-                file = original_message.document
-                file_name = file.file_name
-            elif original_message.video:
-                file = original_message.video
-                file_name = file.file_name or f"video_{file.file_id}.mp4"
-            elif original_message.audio:
-                file = original_message.audio
-                file_name = file.file_name or f"audio_{file.file_id}.mp3"
-            elif original_message.photo:
-                file = original_message.photo[-1]
-                file_name = f"photo_{file.file_id}.jpg"
-            else:
-                await status_message.edit_text("❌ Unsupported file type")
+            file, file_name = get_media_file(original_message)
+            if not file:
+                await sink.finish(False, "❌ Unsupported file type")
                 return
             
             file_path = download_dir / file_name
-            await original_message.download(str(file_path))
-
-        # Start upload with progress tracking
-        start_time = time.time()
-        last_update_time = start_time
-        last_uploaded = 0
-        file_size = file_path.stat().st_size
-
-        async def progress_callback(current, total):
-            nonlocal last_update_time, last_uploaded
-            
-            current_time = time.time()
-            if current_time - last_update_time < 0.5:
-                return
-            
-            # Calculate speed and progress
-            time_diff = current_time - last_update_time
-            bytes_per_second = (current - last_uploaded) / time_diff
-            speed = format_speed(bytes_per_second)
-            
-            percent = (current * 100) / total
-            progress_bar = create_progress_bar(percent)
-            uploaded_size = format_size(current)
-            total_size_str = format_size(total)
-            
-            status_text = (
-                f"📤 Uploading to Telegram\n"
-                f"⬆️ Progress: {percent:.1f}%\n"
-                f"{progress_bar}\n"
-                f"{uploaded_size} / {total_size_str}\n"
-                f"🚀 Speed: {speed}"
+            if job:
+                job.track(file_path, download_dir / f"{file_name}.temp")
+            await original_message.download(
+                str(file_path), progress=job.progress_checkpoint if job else None
             )
-            
-            try:
-                await status_message.edit_text(status_text)
-            except Exception as e:
-                print(f"Error updating status: {e}")
-            
-            last_update_time = current_time
-            last_uploaded = current
 
         # Upload the file back to Telegram
-        await client.send_document(
-            chat_id=original_message.chat.id,
-            document=str(file_path),
-            progress=progress_callback,
-            caption="📤 Here's your uploaded file"
-        )
+        await send_to_telegram(client, original_message.chat.id, file_path, sink, job)
         
-        await status_message.edit_text("✅ File uploaded successfully to Telegram!")
+        await sink.finish(True, "✅ File uploaded successfully to Telegram!")
 
     except Exception as e:
-        await status_message.edit_text(f"❌ Upload failed: {str(e)[:1000]}")
+        await sink.finish(False, f"❌ Upload failed: {str(e)[:1000]}")
     
     finally:
         # Clean up
         if 'file_path' in locals() and file_path.exists():
             file_path.unlink()
-        if user_id in user_states:
-            del user_states[user_id]
-    
-async def upload_to_rclone(download_path, remote, path, user_id, status_message):
-    """
-    Upload downloaded file to rclone remote storage with consistent progress tracking
-    Returns True if successful, False if failed
-    """
-    try:
-        # Setup paths
-        config_path = Path("config") / str(user_id) / "rclone.conf"
-        file_name = download_path.name
-        remote_path = f"{remote}:{path}/{file_name}" if path else f"{remote}:{file_name}"
-        
-        # Get actual file size before upload for more accurate progress tracking
-        local_file_size = download_path.stat().st_size
-        formatted_file_size = format_size(local_file_size)
-        
-        # Start upload with improved progress tracking
-        await status_message.edit_text(
-            f"📤 Preparing to upload to {remote}\n"
-            f"📄 File: {file_name}\n"
-            f"📦 Size: {formatted_file_size}\n"
-            f"⏱️ Calculating transfer details..."
-        )
-        
-        # Start rclone process
-        process = await asyncio.create_subprocess_exec(
-            "rclone", "copy",
-            str(download_path),
-            remote_path,
-            "--config", str(config_path),
-            "--progress",
-            "--stats", "1s",
-            "--no-check-certificate",  # Add if having SSL verification issues
-            "-v",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Variables to track progress
-        last_update = 0
-        confirmed_size = 0
-        
-        while True:
-            try:
-                line = await process.stdout.readline()
-                if not line:
-                    break
-                    
-                data = line.decode().strip()
-                if "Transferred:" in data:
-                    match = re.search(
-                        r"Transferred:\s+([\d.]+\s*\w+)\s+/\s+([\d.]+\s*\w+),\s+([\d.]+%)\s*,\s+([\d.]+\s*\w+/s),\s+ETA\s+([\w\s]+)",
-                        data
-                    )
-                    
-                    if match and (current_time := asyncio.get_event_loop().time()) - last_update >= 1:
-                        transferred, reported_total, percentage, speed, eta = match.groups()
-                        
-                        # Convert transferred to bytes for consistency check
-                        transferred_value = float(transferred.split()[0])
-                        transferred_unit = transferred.split()[1]
-                        transferred_bytes = convert_to_bytes(transferred_value, transferred_unit)
-                        
-                        # Use local_file_size for consistency in progress calculation
-                        if transferred_bytes > confirmed_size:
-                            confirmed_size = transferred_bytes
-                        
-                        # Calculate consistent progress based on local file size
-                        progress_value = min(100, max(0, (confirmed_size * 100) / local_file_size))
-                        
-                        progress_text = (
-                            f"📤 Uploading to {remote}\n"
-                            f"📄 File: {file_name}\n"
-                            f"{create_progress_bar(progress_value)} {progress_value:.1f}%\n"
-                            f"⚡ Speed: {speed}\n"
-                            f"📦 Progress: {transferred} / {formatted_file_size}\n"
-                            f"⏳ ETA: {eta}"
-                        )
-                        
-                        try:
-                            await status_message.edit_text(progress_text)
-                            last_update = current_time
-                        except Exception as e:
-                            print(f"Error updating status message: {e}")
-            
-            except Exception as e:
-                print(f"Error reading process output: {e}")
-                continue
-        
-        # Wait for process to complete
-        await process.wait()
-        
-        if process.returncode == 0:
-            await status_message.edit_text(
-                f"✅ Successfully uploaded to `{remote_path}`\n"
-                f"📄 **File:** `{file_name}`\n"
-                f"📦 **Size:** `{formatted_file_size}`"
-            )
-            return True
-        else:
-            stderr = (await process.stderr.read()).decode()
-            error_details = '\n'.join(stderr.splitlines()[-5:])
-            await status_message.edit_text(
-                f"❌ Upload failed with error code {process.returncode}\n\n"
-                f"Error details:\n{error_details}"
-            )
-            return False
-            
-    except Exception as e:
-        await status_message.edit_text(
-            f"❌ Upload failed: {str(e)[:1000]}"
-        )
-        return False
     
-    finally:
-        # Clean up just the specific file, not the entire folder
-        if download_path.exists():
-            try:
-                download_path.unlink()  # Remove just the file
-                print(f"Deleted file: {download_path}")
-            except Exception as e:
-                print(f"Error deleting file {download_path}: {e}")
-        
-        # Clean up user state
-        if user_id in user_states:
-            del user_states[user_id]
-
+# ========== Mirror Mode ==========
+async def send_mirror_file(chat_id, file_path, job, caption, file_name):
+    """Upload a mirrored file to a chat, returns its Telegram file_id"""
+    sent = await send_to_telegram(app, chat_id, file_path, ProgressSink(), job, caption, file_name)
+    file, _ = get_media_file(sent) if sent else (None, None)
+    return file.file_id if file else None
 
+mirror_watcher = MirrorWatcher(app, navigator.list_rclone_files, send_mirror_file)
 
 # ========== Callback Handlers ==========
 async def handle_file_selection(callback_query, user_id, remote, path):
@@ -637,28 +451,58 @@ async def handle_file_selection(callback_query, user_id, remote, path):
         await callback_query.answer("❌ No active upload session")
         return
     
+    # The selection consumes the session, so a new one can start while this transfer runs
     original_message = user_state["message"]
-    await callback_query.message.edit_reply_markup(None)
-    status_message = await callback_query.message.reply("⏳ Starting download...")
+    del user_states[user_id]
+    navigator.registry.clear(user_id)
     
+    await callback_query.message.edit_reply_markup(None)
+    job = TransferJob(user_id)
+    status_message = await callback_query.message.reply("⏳ Starting download...", reply_markup=job_controls(job))
+    sink = TelegramSink(status_message, job)
+    if "archive" in user_state:
+        job.start(transfer_archive(user_state["archive"], user_id, remote, path, sink, job), sink)
+    else:
+        job.start(transfer_to_rclone(original_message, user_id, remote, path, sink, job), sink)
+
+async def transfer_to_rclone(original_message, user_id, remote, path, sink, job):
+    """Download a URL or Telegram file and upload it to an rclone remote"""
     try:
         # Handle URL downloads
         if original_message.text:
-            download_path = await download_file_from_url(original_message.text, user_id, status_message)
+            download_dir = Path("downloads") / str(user_id)
+            download_path = await download_file_from_url(original_message.text, download_dir, sink, job)
         # Handle Telegram file downloads
         else:
-            download_path = await download_telegram_file(original_message, user_id, status_message)
+            download_path = await download_telegram_file(original_message, user_id, sink, job)
         
-        if download_path:
-            await upload_to_rclone(Path(download_path), remote, path, user_id, status_message)
+        config_path = Path("config") / str(user_id) / "rclone.conf"
+        if download_path and await upload_to_rclone(Path(download_path), remote, path, config_path, sink, job):
+            destination_history.record(user_id, remote, path)
     
     except Exception as e:
-        await status_message.edit_text(f"❌ Error: {str(e)[:1000]}")
+        await sink.finish(False, f"❌ Error: {str(e)[:1000]}")
+
+async def transfer_archive(archive, user_id, remote, path, sink, job):
+    """Stream collected items as one archive to an rclone remote"""
+    config_path = Path("config") / str(user_id) / "rclone.conf"
+    if await archive_to_rclone(
+        archive["sources"], archive["name"], archive["format"], remote, path, config_path, sink, job
+    ):
+        destination_history.record(user_id, remote, path)
+
+async def collect_archive_item(message):
+    """Add a file or URL to the user's pending archive, returns True if collected"""
+    state = user_states.get(message.from_user.id, {})
+    if state.get("action") != "collecting_archive":
+        return False
     
-    finally:
-        # Clean up user state
-        if user_id in user_states:
-            del user_states[user_id]
+    state["items"].append(message)
+    await message.reply(
+        f"➕ Added to {state['name']} ({len(state['items'])} items)\n"
+        "Send more files or URLs, then /pack to upload"
+    )
+    return True
 
 # ====================================================
 # Command Handlers
@@ -669,7 +513,10 @@ async def start(client, message):
     await message.reply(
         "Welcome!\n"
         "1. Send /config to upload your rclone.conf file\n"
-        "2. Send any direct URL to upload to your cloud storage"
+        "2. Send any direct URL to upload to your cloud storage\n"
+        "3. Use /find <name> to jump straight to a destination folder\n"
+        "4. Use /archive to upload several items as one archive\n"
+        "5. Use /mirror to post new files from a remote folder to this chat"
     )
 
 @app.on_message(filters.command("config"))
@@ -679,6 +526,221 @@ async def config_command(client, message):
     user_states[user_id] = {"action": "awaiting_config"}
     await message.reply("Please send your rclone.conf file now.")
 
+@app.on_message(filters.command("archive"))
+@owner_only
+async def archive_command(client, message):
+    """Start collecting files and URLs to upload as one archive"""
+    user_id = message.from_user.id
+    args = message.command[1:]
+    formats = available_formats()
+    
+    fmt = args[1] if len(args) > 1 else "zip"
+    if fmt not in formats:
+        await message.reply(f"❌ Unknown archive format. Available: {', '.join(formats)}")
+        return
+    # The name becomes part of the remote path, so clean it like a file name
+    name = re.sub(r'[\\/*?:"<>|]', "_", args[0]) if args else time.strftime("archive_%Y%m%d_%H%M%S")
+    name = archive_name(name, fmt)
+    
+    user_states[user_id] = {"action": "collecting_archive", "name": name, "format": fmt, "items": []}
+    await message.reply(
+        f"📦 Collecting items for {name}\n"
+        "Send files or URLs, then /pack to upload them as one archive"
+    )
+
+@app.on_message(filters.command("pack"))
+@owner_only
+async def pack_command(client, message):
+    """Pick a destination for the collected archive items"""
+    user_id = message.from_user.id
+    state = user_states.get(user_id, {})
+    if state.get("action") != "collecting_archive" or not state["items"]:
+        await message.reply("❌ Nothing to pack. Start with /archive [name] [format]")
+        return
+    
+    config_path = Path("config") / str(user_id) / "rclone.conf"
+    if not config_path.exists():
+        await message.reply("❌ Please upload your rclone.conf file first using /config")
+        return
+    remotes = await navigator.get_rclone_remotes(user_id)
+    if not remotes:
+        await message.reply("❌ No remotes found in your rclone config")
+        return
+    directory_index.refresh(user_id, remotes)
+    
+    sources = [
+        url_source(item.text) if item.text else telegram_source(client, item)
+        for item in state["items"]
+    ]
+    user_states[user_id] = {
+        "action": "selecting_path",
+        "message": message,
+        "archive": {"name": state["name"], "format": state["format"], "sources": sources}
+    }
+    
+    await message.reply(
+        f"🌩 Select a cloud storage for {state['name']} ({len(sources)} items):",
+        reply_markup=navigator.build_remote_keyboard(user_id, remotes)
+    )
+
+@app.on_message(filters.command("bwlimit"))
+@owner_only
+async def bwlimit_command(client, message):
+    """Show or change bandwidth limits while transfers are running"""
+    args = message.command[1:]
+    try:
+        if args and args[0] == "schedule":
+            bandwidth.schedule = [] if args[1:] in ([], ["off"]) else parse_schedule(" ".join(args[1:]))
+        elif len(args) == 2 and args[0] in bandwidth.class_limits:
+            bandwidth.class_limits[args[0]] = parse_rate(args[1])
+        elif len(args) == 3 and args[0] == "job":
+            job = transfer_jobs.get(args[1])
+            if not job:
+                await message.reply(f"❌ No running transfer with id {args[1]}")
+                return
+            job.limit = parse_rate(args[2])
+        elif len(args) == 1:
+            bandwidth.base_rate = parse_rate(args[0])
+        elif args:
+            raise ValueError("Unknown arguments")
+    except (ValueError, IndexError):
+        await message.reply(
+            "Usage:\n"
+            "/bwlimit - show limits\n"
+            "/bwlimit <rate|off> - global limit, e.g. 10M\n"
+            "/bwlimit <interactive|normal|bulk> <rate|off> - class limit\n"
+            "/bwlimit schedule <HH:MM,rate ...|off> - time-of-day limits\n"
+            "/bwlimit job <id> <rate|off> - limit a running transfer"
+        )
+        return
+    
+    bandwidth.rebalance()
+    
+    lines = [f"🚦 Global: {format_rate(bandwidth.global_rate())}"]
+    if bandwidth.schedule:
+        lines.append("🕒 Schedule: " + " ".join(
+            f"{start // 60:02d}:{start % 60:02d},{format_rate(rate)}" for start, rate in bandwidth.schedule
+        ))
+        if len(args) == 1:
+            lines.append(
+                f"⚠️ The schedule overrides the global limit, {format_rate(bandwidth.base_rate)} "
+                "applies after /bwlimit schedule off"
+            )
+    lines.append("📊 Classes: " + ", ".join(
+        f"{priority} {format_rate(rate)}" for priority, rate in bandwidth.class_limits.items()
+    ))
+    for job in transfer_jobs.values():
+        state = "paused" if job.paused else format_rate(bandwidth.rate_for(job))
+        lines.append(f"• {job.id} ({job.priority}): {state}")
+    await message.reply("\n".join(lines))
+
+@app.on_message(filters.command("find"))
+@owner_only
+async def find_command(client, message):
+    """Search the folder index and offer direct destination buttons"""
+    user_id = message.from_user.id
+    query = " ".join(message.command[1:]).strip()
+    
+    config_path = Path("config") / str(user_id) / "rclone.conf"
+    if not config_path.exists():
+        await message.reply("❌ Please upload your rclone.conf file first using /config")
+        return
+    
+    remotes = await navigator.get_rclone_remotes(user_id)
+    directory_index.refresh(user_id, remotes)
+    
+    if query:
+        results = directory_index.search(user_id, query, remotes)
+        header = f"🔍 Folders matching '{query}':"
+    else:
+        results = [loc for loc in destination_history.suggestions(user_id) if loc[0] in remotes]
+        header = "⭐ Recent destinations:"
+    
+    if not results:
+        if directory_index.is_building(user_id):
+            await message.reply("⏳ Folder index is still being built, please try again shortly.")
+        elif query:
+            await message.reply(f"❌ No folders matching '{query}'")
+        else:
+            await message.reply("Usage: /find <folder name>")
+        return
+    
+    if user_states.get(user_id, {}).get("action") != "selecting_path":
+        header += "\n(Send a file or URL and choose Rclone, then pick a folder below)"
+    
+    keyboard = []
+    for remote, path in results:
+        token = navigator.encode_path(user_id, remote, path)
+        keyboard.append([
+            InlineKeyboardButton(f"✅ {format_location(remote, path)}", callback_data=f"sel_{token}"),
+            InlineKeyboardButton("📂", callback_data=f"nav_{token}")
+        ])
+    await message.reply(header, reply_markup=InlineKeyboardMarkup(keyboard))
+
+@app.on_message(filters.command("mirror"))
+@owner_only
+async def mirror_command(client, message):
+    """Watch remote folders and post their new or changed files to this chat"""
+    user_id = message.from_user.id
+    args = message.command[1:]
+    action = args[0] if args else ""
+    
+    if action == "add" and len(args) in (2, 3) and ":" in args[1]:
+        config_path = Path("config") / str(user_id) / "rclone.conf"
+        if not config_path.exists():
+            await message.reply("❌ Please upload your rclone.conf file first using /config")
+            return
+        remote, path = args[1].split(":", 1)
+        if remote not in await navigator.get_rclone_remotes(user_id):
+            await message.reply(f"❌ Unknown remote: {remote}")
+            return
+        try:
+            interval = parse_interval(args[2]) if len(args) == 3 else mirror_watcher.default_interval
+        except ValueError as e:
+            await message.reply(f"❌ {e}")
+            return
+        if interval < mirror_watcher.min_interval:
+            await message.reply(f"❌ Interval must be at least {format_interval(mirror_watcher.min_interval)}")
+            return
+        
+        status_message = await message.reply(f"⏳ Taking a snapshot of {remote}:{path}...")
+        mirror = await mirror_watcher.add(user_id, message.chat.id, remote, path.strip('/'), interval)
+        if not mirror:
+            await status_message.edit_text(f"❌ Could not list {remote}:{path}")
+            return
+        await status_message.edit_text(
+            f"🪞 Mirror {mirror['id']} is watching {remote}:{mirror['path']} every {format_interval(interval)}\n"
+            f"📄 {len(mirror['snapshot'])} existing files, new or changed files will be posted here"
+        )
+    
+    elif action == "list" and len(args) == 1:
+        mirrors = mirror_watcher.user_mirrors(user_id)
+        if not mirrors:
+            await message.reply("No mirrors yet. Add one with /mirror add remote:path [interval]")
+            return
+        lines = ["🪞 Mirrors:"]
+        for mirror in mirrors:
+            lines.append(
+                f"• {mirror['id']}: {mirror['remote']}:{mirror['path']} every "
+                f"{format_interval(mirror['interval'])}, {len(mirror['snapshot'])} files, "
+                f"last checked {time.strftime('%Y-%m-%d %H:%M', time.localtime(mirror['last_poll']))}"
+            )
+        await message.reply("\n".join(lines))
+    
+    elif action == "remove" and len(args) == 2:
+        if mirror_watcher.remove(user_id, args[1]):
+            await message.reply(f"✅ Mirror {args[1]} removed")
+        else:
+            await message.reply(f"❌ No mirror with id {args[1]}")
+    
+    else:
+        await message.reply(
+            "Usage:\n"
+            "/mirror add <remote:path> [interval] - post new or changed files here, e.g. 30m\n"
+            "/mirror list - show mirrors\n"
+            "/mirror remove <id> - stop a mirror"
+        )
+
 @app.on_message(filters.document)
 async def handle_document(client, message):
     user_id = message.from_user.id
@@ -691,11 +753,16 @@ async def handle_document(client, message):
             config_path = user_dir / "rclone.conf"
             await message.download(str(config_path))
             del user_states[user_id]
+            rclone_configs.invalidate(config_path)
+            directory_index.invalidate(user_id)
             await message.reply("✅ Config saved successfully!")
         else:
             await message.reply("❌ Please send a file named 'rclone.conf'")
         return
     
+    if await collect_archive_item(message):
+        return
+    
     # Handle general document case
     try:
         # Check if config exists
@@ -705,11 +772,11 @@ async def handle_document(client, message):
             return
         
         # Get available remotes
-        navigator = RcloneNavigator()
-        remotes = navigator.get_rclone_remotes(user_id)
+        remotes = await navigator.get_rclone_remotes(user_id)
         if not remotes:
             await message.reply("❌ No remotes found in your rclone config")
             return
+        directory_index.refresh(user_id, remotes)
         
         # Store message info in state
         user_states[user_id] = {
@@ -717,20 +784,9 @@ async def handle_document(client, message):
             "message": message
         }
         
-        # Create remote selection buttons
-        keyboard = []
-        for i in range(0, len(remotes), 2):
-            row = [
-                InlineKeyboardButton(
-                    f"🌐 {remote[:15]}..." if len(remote) > 15 else f"🌐 {remote}",
-                    callback_data=f"nav_{remote}:"
-                ) for remote in remotes[i:i+2]
-            ]
-            keyboard.append(row)
-        
         await message.reply(
             "🌩 Select a cloud storage:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=navigator.build_remote_keyboard(user_id, remotes)
         )
         
     except Exception as e:
@@ -743,6 +799,9 @@ async def handle_media(client, message):
     """Handle incoming URLs and files with platform selection"""
     user_id = message.from_user.id
     
+    if await collect_archive_item(message):
+        return
+    
     # Create platform selection buttons
     keyboard = [
         [
@@ -776,8 +835,11 @@ async def handle_platform_selection(client, callback_query):
     
     if platform == "telegram":
         # Initialize upload to Telegram
-        await callback_query.message.edit_text("⏳ Starting Telegram upload...")
-        await upload_to_telegram(client, original_message, callback_query.message)
+        del user_states[user_id]
+        job = TransferJob(user_id)
+        await callback_query.message.edit_text("⏳ Starting Telegram upload...", reply_markup=job_controls(job))
+        sink = TelegramSink(callback_query.message, job)
+        job.start(upload_to_telegram(client, original_message, sink, job), sink)
     
     elif platform == "rclone":
         # Check rclone config
@@ -790,38 +852,26 @@ async def handle_platform_selection(client, callback_query):
             return
         
         # Get remotes
-        navigator = RcloneNavigator()
-        remotes = navigator.get_rclone_remotes(user_id)
+        remotes = await navigator.get_rclone_remotes(user_id)
         if not remotes:
             await callback_query.message.edit_text(
                 "❌ No remotes found in your rclone config",
                 reply_markup=None
             )
             return
+        directory_index.refresh(user_id, remotes)
         
         # Update state
         user_states[user_id]["action"] = "selecting_path"
         
-        # Create remote selection buttons
-        keyboard = []
-        for i in range(0, len(remotes), 2):
-            row = [
-                InlineKeyboardButton(
-                    f"🌐 {remote[:15]}..." if len(remote) > 15 else f"🌐 {remote}",
-                    callback_data=f"nav_{remote}:"
-                ) for remote in remotes[i:i+2]
-            ]
-            keyboard.append(row)
-        
         await callback_query.message.edit_text(
             "🌩 Select a cloud storage:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=navigator.build_remote_keyboard(user_id, remotes)
         )
 
 # ====================================================
 # Callback Handlers
 # ====================================================
-navigator = RcloneNavigator()
 
 @app.on_callback_query()
 async def handle_callback(client, callback_query):
@@ -829,37 +879,69 @@ async def handle_callback(client, callback_query):
         user_id = callback_query.from_user.id
         data = callback_query.data
 
+        if data.startswith("job_"):
+            _, action, job_id = data.split("_", 2)
+            job = transfer_jobs.get(job_id)
+            if not job or job.user_id != user_id:
+                await callback_query.answer("❌ Transfer is no longer running", show_alert=True)
+                return
+            
+            if action == "cancel":
+                job.cancel()
+                await callback_query.answer("Cancelling transfer...")
+                return
+            if action == "pause":
+                job.pause()
+                await callback_query.answer("⏸ Transfer paused")
+            else:
+                job.resume()
+                await callback_query.answer("▶️ Transfer resumed")
+            await callback_query.message.edit_reply_markup(job_controls(job))
+            return
+
         if data == "nav_root":
             await navigator.show_remote_selection(client, callback_query, user_id)
             await callback_query.answer()
             return
         
         if data.startswith("nav_") or data.startswith("sel_"):
-            action, encoded_path = data.split("_", 1)
+            action, token = data.split("_", 1)
             
-            if encoded_path == "root":
+            if token == "root":
                 await navigator.show_remote_selection(client, callback_query, user_id)
                 return
 
-            if ":" in encoded_path:
-                remote, path = encoded_path.split(":", 1)
-                path = path.split("#")[0].replace(':', '').strip('/')
-                
-                if action == "nav":
-                    await navigator.list_path(client, callback_query, user_id, remote, path)
+            location = navigator.decode_path(user_id, token)
+            if not location:
+                await callback_query.answer("❌ Session expired. Please try again.", show_alert=True)
+                return
+            
+            remote, path = location
+            if action == "nav":
+                navigator.user_states.setdefault(user_id, {})["nav_page"] = 0
+                if await navigator.list_path(client, callback_query, user_id, remote, path):
                     await callback_query.answer()
-                else:  # sel
-                    await handle_file_selection(callback_query, user_id, remote, path)
-            else:
-                await callback_query.answer("Invalid path format", show_alert=True)
+            else:  # sel
+                await handle_file_selection(callback_query, user_id, remote, path)
     
-        if data.startswith("page_"):
+        if data == "page_info":
+            await callback_query.answer()
+        elif data.startswith("page_"):
             page = int(data.split("_")[1])
-            navigator.user_states.setdefault(user_id, {})["nav_page"] = page
-            await navigator.list_path(client, callback_query, user_id, remote, path)
+            state = navigator.user_states.setdefault(user_id, {})
+            if "location" not in state:
+                await callback_query.answer("❌ Session expired. Please try again.", show_alert=True)
+                return
+            state["nav_page"] = page
+            remote, path = state["location"]
+            if await navigator.list_path(client, callback_query, user_id, remote, path):
+                await callback_query.answer()
         elif data == "cancel_upload":
             if user_id in navigator.user_states:
                 del navigator.user_states[user_id]
+            if user_id in user_states:
+                del user_states[user_id]
+            navigator.registry.clear(user_id)
             await callback_query.message.edit_text("❌ Upload cancelled")
             await callback_query.answer()
             
@@ -868,6 +950,34 @@ async def handle_callback(client, callback_query):
         print(error_msg)
         await callback_query.answer(error_msg[:200], show_alert=True)
 
-keep_alive()
+# ========== Startup ==========
+async def warm_up():
+    """
+    Get the first transfer's dependencies ready while Telegram logs in:
+    resolve and run rclone once, parse saved configs and open the HTTP session.
+    """
+    try:
+        print(f"Using {await rclone.check()}")
+    except (OSError, RuntimeError, asyncio.TimeoutError) as e:
+        print(f"rclone check failed, transfers to remotes will not work: {e}")
+
+    # Parse uploaded configs so the first remote picker renders instantly
+    for config_path in Path("config").glob("*/rclone.conf"):
+        rclone_configs.get(config_path)
+    http_session()
+
+async def main():
+    # Create necessary directories
+    Path("downloads").mkdir(exist_ok=True)
+    Path("config").mkdir(exist_ok=True)
+    keep_alive()
+
+    # Telegram login and the warm-up don't depend on each other
+    await asyncio.gather(app.start(), warm_up())
+    mirror_watcher.load()
+    print("Bot is ready")
+    await idle()
+    await app.stop()
+
 if __name__ == "__main__":
-    app.run()
+    app.run(main())
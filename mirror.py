@@ -0,0 +1,300 @@
+import os
+import re
+import json
+import time
+import secrets
+import asyncio
+from pathlib import Path
+from rclone_runner import rclone
+from bandwidth import bandwidth, format_rate
+from transfer import TransferJob, ProgressSink, format_size
+
+# Telegram bots can't upload files larger than this
+TELEGRAM_MAX_UPLOAD = 2000 * 1024 * 1024
+
+# Preferred hash types for fingerprinting files, strongest first
+MIRROR_HASHES = ("sha256", "sha1", "md5")
+
+def parse_interval(text):
+    """Parse an interval like '90s', '15m', '2h' or '1d' into seconds (bare numbers are minutes)"""
+    match = re.fullmatch(r"(\d+)([smhd]?)", text.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid interval: {text}")
+    value, unit = match.groups()
+    return int(value) * {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}[unit or "m"]
+
+def format_interval(seconds):
+    """Format seconds in the largest whole unit parse_interval understands"""
+    for unit, size in (("d", 24 * 60 * 60), ("h", 60 * 60), ("m", 60)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+class MirrorWatcher:
+    """
+    Post new and changed files of watched remote folders to Telegram chats.
+    Each mirror keeps a snapshot (size, modtime, hash) of its last listing in
+    config/<user>/mirrors/<id>.json, so a poll only sends the difference.
+    Sent files are remembered by content fingerprint with their Telegram
+    file_id, so content posted before is re-sent without uploading it again.
+    Listing folders and uploading files are passed in: list_files(user_id,
+    remote, path) returns an lsjson listing or None, and send_file(chat_id,
+    file_path, job, caption, file_name) returns the uploaded file's file_id.
+    """
+    def __init__(self, client, list_files, send_file, min_interval=60,
+                 copy_timeout=60 * 60, max_file_ids=10000):
+        self.client = client
+        self.list_files = list_files
+        self.send_file = send_file
+        self.min_interval = min_interval
+        # A bad setting must not keep the bot from starting
+        try:
+            max_sends = int(os.getenv('MIRROR_MAX_SENDS', '2'))
+            if max_sends < 1:
+                raise ValueError(f"must be at least 1: {max_sends}")
+        except ValueError as e:
+            print(f"Ignoring MIRROR_MAX_SENDS: {e}")
+            max_sends = 2
+        try:
+            self.default_interval = parse_interval(os.getenv('MIRROR_INTERVAL', '15m'))
+        except ValueError as e:
+            print(f"Ignoring MIRROR_INTERVAL: {e}")
+            self.default_interval = 15 * 60
+        if self.default_interval < min_interval:
+            print(f"MIRROR_INTERVAL is below {format_interval(min_interval)}, using that instead")
+            self.default_interval = min_interval
+        self.copy_timeout = copy_timeout
+        self.max_file_ids = max_file_ids
+        self.send_limit = asyncio.Semaphore(max_sends)
+        self.mirrors = {}
+        self.tasks = {}
+        self.file_ids = {}
+        self.uploads = {}
+
+    def _mirror_path(self, user_id, mirror_id):
+        """Get the snapshot file path of a mirror"""
+        return Path("config") / str(user_id) / "mirrors" / f"{mirror_id}.json"
+
+    def _file_ids_path(self, user_id):
+        """Get the file_id cache path for a user"""
+        return Path("config") / str(user_id) / "telegram_files.json"
+
+    def _save(self, mirror):
+        """Persist a mirror and its snapshot"""
+        try:
+            mirror_path = self._mirror_path(mirror["user_id"], mirror["id"])
+            mirror_path.parent.mkdir(parents=True, exist_ok=True)
+            mirror_path.write_text(json.dumps(mirror))
+        except OSError as e:
+            print(f"Error saving mirror {mirror['id']}: {e}")
+
+    def _load_file_ids(self, user_id):
+        """Load a user's fingerprint -> file_id cache"""
+        if user_id not in self.file_ids:
+            try:
+                self.file_ids[user_id] = json.loads(self._file_ids_path(user_id).read_text())
+            except (OSError, ValueError):
+                self.file_ids[user_id] = {}
+        return self.file_ids[user_id]
+
+    def _remember_file_id(self, user_id, key, file_id):
+        """Cache the file_id of uploaded content, dropping the oldest entries when full"""
+        file_ids = self._load_file_ids(user_id)
+        file_ids.pop(key, None)
+        file_ids[key] = file_id
+        for old_key in list(file_ids)[:-self.max_file_ids]:
+            del file_ids[old_key]
+        try:
+            file_ids_path = self._file_ids_path(user_id)
+            file_ids_path.parent.mkdir(parents=True, exist_ok=True)
+            file_ids_path.write_text(json.dumps(file_ids))
+        except OSError as e:
+            print(f"Error saving Telegram file ids: {e}")
+
+    def _entry_info(self, entry):
+        """Reduce an lsjson entry to what the snapshot keeps"""
+        hashes = entry.get("Hashes") or {}
+        hash_type = next(
+            (h for h in MIRROR_HASHES if hashes.get(h)),
+            min((h for h in hashes if hashes[h]), default=None)
+        )
+        return {
+            "size": entry.get("Size", 0),
+            "modtime": entry.get("ModTime", ""),
+            "hash": f"{hash_type}:{hashes[hash_type]}" if hash_type else None
+        }
+
+    def _remote_path(self, mirror, path):
+        """Full rclone path of a file below a mirror's folder"""
+        return f"{mirror['remote']}:" + "/".join(p for p in (mirror["path"], path) if p)
+
+    def _fingerprint(self, mirror, path, info):
+        """Identify file content: by hash if known, else by location, size and modtime"""
+        if info["hash"]:
+            return info["hash"]
+        return f"{self._remote_path(mirror, path)}|{info['size']}|{info['modtime']}"
+
+    def load(self):
+        """Load all saved mirrors and start watching them"""
+        for mirror_path in Path("config").glob("*/mirrors/*.json"):
+            try:
+                mirror = json.loads(mirror_path.read_text())
+            except (OSError, ValueError) as e:
+                print(f"Error loading mirror {mirror_path}: {e}")
+                continue
+            self.mirrors[mirror["id"]] = mirror
+            self._schedule(mirror)
+
+    def _schedule(self, mirror):
+        task = self.tasks.get(mirror["id"])
+        if not task or task.done():
+            self.tasks[mirror["id"]] = asyncio.create_task(self._watch(mirror))
+
+    async def _watch(self, mirror):
+        """Poll a mirror on its interval, continuing the schedule across restarts"""
+        while True:
+            await asyncio.sleep(max(0, mirror["last_poll"] + mirror["interval"] - time.time()))
+            try:
+                await self.poll(mirror)
+            except Exception as e:
+                print(f"Error polling mirror {mirror['id']}: {e}")
+            mirror["last_poll"] = time.time()
+            self._save(mirror)
+
+    async def add(self, user_id, chat_id, remote, path, interval):
+        """Take the initial snapshot of a folder and start watching it, None if listing failed"""
+        listing = await self.list_files(user_id, remote, path)
+        if listing is None:
+            return None
+        
+        mirror_id = secrets.token_hex(3)
+        while mirror_id in self.mirrors:
+            mirror_id = secrets.token_hex(3)
+        mirror = {
+            "id": mirror_id,
+            "user_id": user_id,
+            "chat_id": chat_id,
+            "remote": remote,
+            "path": path,
+            "interval": interval,
+            "last_poll": time.time(),
+            "snapshot": {entry["Path"]: self._entry_info(entry) for entry in listing}
+        }
+        self.mirrors[mirror_id] = mirror
+        self._save(mirror)
+        self._schedule(mirror)
+        return mirror
+
+    def remove(self, user_id, mirror_id):
+        """Stop and delete a mirror, returns False if the user has no such mirror"""
+        mirror = self.mirrors.get(mirror_id)
+        if not mirror or mirror["user_id"] != user_id:
+            return False
+        del self.mirrors[mirror_id]
+        task = self.tasks.pop(mirror_id, None)
+        if task:
+            task.cancel()
+        try:
+            self._mirror_path(user_id, mirror_id).unlink()
+        except OSError as e:
+            print(f"Error deleting mirror {mirror_id}: {e}")
+        return True
+
+    def user_mirrors(self, user_id):
+        """Mirrors owned by a user"""
+        return [mirror for mirror in self.mirrors.values() if mirror["user_id"] == user_id]
+
+    async def poll(self, mirror):
+        """List a mirror's folder and post what changed since the last snapshot"""
+        listing = await self.list_files(mirror["user_id"], mirror["remote"], mirror["path"])
+        if listing is None:
+            return
+        
+        snapshot = mirror["snapshot"]
+        current = {entry["Path"]: self._entry_info(entry) for entry in listing}
+        changed = [
+            path for path, info in sorted(current.items())
+            if path not in snapshot
+            or self._fingerprint(mirror, path, snapshot[path]) != self._fingerprint(mirror, path, info)
+        ]
+        for path in set(snapshot) - set(current):
+            del snapshot[path]
+        
+        # Failed files stay out of the snapshot and are retried on the next poll
+        results = await asyncio.gather(*(self._post(mirror, path, current[path]) for path in changed))
+        for path, posted in zip(changed, results):
+            if posted:
+                snapshot[path] = current[path]
+
+    async def _post(self, mirror, path, info):
+        """Send one file to the mirror's chat, returns True once it is posted"""
+        # Content already being sent is waited for and then re-sent by its file_id
+        upload_key = (mirror["user_id"], self._fingerprint(mirror, path, info))
+        while upload_key in self.uploads:
+            await self.uploads[upload_key].wait()
+        done = self.uploads[upload_key] = asyncio.Event()
+        try:
+            return await self._send(mirror, path, info)
+        finally:
+            del self.uploads[upload_key]
+            done.set()
+
+    async def _send(self, mirror, path, info):
+        """Post a file by its cached file_id, or upload it"""
+        user_id = mirror["user_id"]
+        key = self._fingerprint(mirror, path, info)
+        caption = f"🪞 {self._remote_path(mirror, path)}"
+        
+        async with self.send_limit:
+            file_id = self._load_file_ids(user_id).get(key)
+            if file_id:
+                try:
+                    await self.client.send_document(mirror["chat_id"], file_id, caption=caption)
+                    return True
+                except Exception as e:
+                    # Stale file_id, fall back to uploading the file again
+                    print(f"Error re-sending {caption} by file_id: {e}")
+                    self._load_file_ids(user_id).pop(key, None)
+            
+            try:
+                if info["size"] > TELEGRAM_MAX_UPLOAD:
+                    await self.client.send_message(
+                        mirror["chat_id"], f"⚠️ Too large for Telegram ({format_size(info['size'])}):\n{caption}"
+                    )
+                    return True
+                job = TransferJob(user_id)
+                file_id = await job.start(self._transfer(mirror, path, info, caption, job), ProgressSink())
+            except Exception as e:
+                print(f"Error mirroring {caption}: {e}")
+                return False
+        
+        if not file_id:
+            return False
+        self._remember_file_id(user_id, key, file_id)
+        return True
+
+    async def _transfer(self, mirror, path, info, caption, job):
+        """Copy a file down from the remote and upload it to the mirror's chat"""
+        # Stage in the job's own folder so concurrent files with the same name don't collide
+        download_dir = job.staging_dir(Path("downloads") / str(mirror["user_id"]) / "mirror")
+        file_name = path.rsplit("/", 1)[-1]
+        file_path = download_dir / file_name
+        
+        args = ['copyto', self._remote_path(mirror, path), str(file_path)]
+        bandwidth.assign(job, info["size"])
+        if bandwidth.rate_for(job):
+            args += ["--bwlimit", format_rate(bandwidth.rate_for(job))]
+        
+        # Run like other transfers, so the job can pause the copy
+        config_path = Path("config") / str(mirror["user_id"]) / "rclone.conf"
+        try:
+            returncode, stderr = await rclone.stream(
+                args, config_path=config_path, remote=mirror["remote"],
+                on_spawn=job.attach, timeout=self.copy_timeout
+            )
+        finally:
+            job.detach()
+        if returncode != 0:
+            print(f"Error copying {caption}: {stderr.strip()[-500:]}")
+            return None
+        return await self.send_file(mirror["chat_id"], file_path, job, caption, file_name)
@@ -0,0 +1,109 @@
+import configparser
+from pathlib import Path
+
+# Capabilities of common rclone backends: supported hash types, whether those
+# hashes are stored with the files (local and sftp compute them by reading
+# every file), server-side copy within the remote and streaming uploads of
+# unknown size (rcat)
+BACKEND_CAPABILITIES = {
+    "drive": {"hashes": ["md5", "sha1", "sha256"], "stored_hashes": True, "server_side_copy": True, "stream_upload": True},
+    "s3": {"hashes": ["md5"], "stored_hashes": True, "server_side_copy": True, "stream_upload": True},
+    "b2": {"hashes": ["sha1"], "stored_hashes": True, "server_side_copy": True, "stream_upload": True},
+    "google cloud storage": {"hashes": ["md5"], "stored_hashes": True, "server_side_copy": True, "stream_upload": True},
+    "azureblob": {"hashes": ["md5"], "stored_hashes": True, "server_side_copy": True, "stream_upload": True},
+    "swift": {"hashes": ["md5"], "stored_hashes": True, "server_side_copy": True, "stream_upload": True},
+    "dropbox": {"hashes": ["dropbox"], "stored_hashes": True, "server_side_copy": True, "stream_upload": True},
+    "onedrive": {"hashes": ["quickxor"], "stored_hashes": True, "server_side_copy": True, "stream_upload": False},
+    "pcloud": {"hashes": ["md5", "sha1"], "stored_hashes": True, "server_side_copy": True, "stream_upload": False},
+    "mega": {"hashes": [], "stored_hashes": False, "server_side_copy": False, "stream_upload": False},
+    "sftp": {"hashes": ["md5", "sha1"], "stored_hashes": False, "server_side_copy": False, "stream_upload": True},
+    "ftp": {"hashes": [], "stored_hashes": False, "server_side_copy": False, "stream_upload": True},
+    "webdav": {"hashes": [], "stored_hashes": False, "server_side_copy": True, "stream_upload": True},
+    "local": {"hashes": ["md5", "sha1", "sha256"], "stored_hashes": False, "server_side_copy": True, "stream_upload": True},
+}
+
+# Unknown backends are assumed to support nothing special
+DEFAULT_CAPABILITIES = {"hashes": [], "stored_hashes": False, "server_side_copy": False, "stream_upload": False}
+
+# Backends that wrap another remote given by their "remote" option
+WRAPPER_BACKENDS = {"crypt", "alias", "chunker", "compress", "hasher"}
+
+class RcloneConfig:
+    """Parsed rclone.conf: remotes, their backend types and capabilities"""
+    def __init__(self, version, remotes, encrypted=False):
+        self.version = version
+        self.remotes = remotes
+        self.encrypted = encrypted
+
+    @classmethod
+    def parse(cls, path, version):
+        text = Path(path).read_text()
+        # Encrypted configs can only be read by rclone itself
+        if text.lstrip().startswith("# Encrypted rclone configuration"):
+            return cls(version, {}, encrypted=True)
+
+        parser = configparser.RawConfigParser(strict=False)
+        parser.read_string(text)
+        remotes = {name: dict(parser.items(name)) for name in parser.sections()}
+        return cls(version, remotes)
+
+    def remote_names(self):
+        """Remote names in config order"""
+        return list(self.remotes)
+
+    def backend(self, remote):
+        """Backend type of a remote, e.g. 'drive' or 's3'"""
+        return self.remotes.get(remote, {}).get("type")
+
+    def capabilities(self, remote, _seen=None):
+        """Capabilities of a remote, resolving wrapper backends to the wrapped remote"""
+        backend = self.backend(remote)
+        if backend in WRAPPER_BACKENDS:
+            seen = (_seen or set()) | {remote}
+            wrapped = self.remotes[remote].get("remote", "").split(":", 1)[0]
+            if wrapped and wrapped not in seen and wrapped in self.remotes:
+                capabilities = dict(self.capabilities(wrapped, seen))
+                # Hashes of the wrapped data don't describe the wrapper's content
+                if backend != "alias":
+                    capabilities["hashes"] = []
+                    capabilities["stored_hashes"] = False
+                return capabilities
+        return BACKEND_CAPABILITIES.get(backend, DEFAULT_CAPABILITIES)
+
+class RcloneConfigCache:
+    """
+    Parsed rclone configs keyed by path.
+    A config is re-parsed only when its mtime or size changes, so remote
+    pickers render without spawning rclone; uploads via /config also
+    invalidate the entry explicitly.
+    """
+    def __init__(self):
+        self.configs = {}
+
+    def get(self, config_path):
+        """Return the parsed config, or None if missing or unreadable"""
+        config_path = Path(config_path)
+        try:
+            stat = config_path.stat()
+        except OSError:
+            self.configs.pop(config_path, None)
+            return None
+
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self.configs.get(config_path)
+        if cached and cached.version == version:
+            return cached
+
+        try:
+            config = RcloneConfig.parse(config_path, version)
+        except (OSError, UnicodeDecodeError, configparser.Error) as e:
+            print(f"Error parsing rclone config {config_path}: {e}")
+            return None
+        self.configs[config_path] = config
+        return config
+
+    def invalidate(self, config_path):
+        """Forget a config so the next lookup re-parses it"""
+        self.configs.pop(Path(config_path), None)
+
+rclone_configs = RcloneConfigCache()
@@ -0,0 +1,226 @@
+import os
+import shutil
+import signal
+import socket
+import asyncio
+from contextlib import asynccontextmanager
+
+# Concurrency limits, overridable from the environment. Transfers, quick
+# interactive listings and long background index builds use separate pools
+# so a tap in the navigator never waits behind an hour-long upload.
+MAX_PROCESSES = int(os.getenv('RCLONE_MAX_PROCESSES', '8'))
+MAX_PER_REMOTE = int(os.getenv('RCLONE_MAX_PER_REMOTE', '3'))
+MAX_LISTINGS = int(os.getenv('RCLONE_MAX_LISTINGS', '8'))
+MAX_INDEX_BUILDS = int(os.getenv('RCLONE_MAX_INDEX_BUILDS', '2'))
+RCLONE_BINARY = os.getenv('RCLONE_BINARY', 'rclone')
+
+class ProcessSlot:
+    """A process's place in its pool and per-remote limit, released while it is paused"""
+    def __init__(self, semaphores):
+        self.semaphores = semaphores
+        self.held = False
+        self.closed = False
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        acquired = []
+        try:
+            for semaphore in self.semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+        self.held = True
+
+    def release(self):
+        if self.held:
+            for semaphore in self.semaphores:
+                semaphore.release()
+            self.held = False
+
+class RcloneRunner:
+    """
+    Run rclone as asyncio subprocesses.
+    Each call runs in a pool: "transfer" for copies, capped globally and per
+    remote so one busy remote can't starve the others, "list" for quick
+    interactive listings and "index" for long background listings. Timeouts and
+    task cancellation kill the child process, and stdout/stderr are always
+    drained concurrently so a chatty process can never block on a full pipe.
+    Paused streaming processes give their slots back until they resume.
+    """
+    def __init__(self, max_processes=MAX_PROCESSES, max_per_remote=MAX_PER_REMOTE,
+                 max_listings=MAX_LISTINGS, max_index_builds=MAX_INDEX_BUILDS, binary=RCLONE_BINARY):
+        self.max_per_remote = max_per_remote
+        self.pools = {
+            "transfer": asyncio.Semaphore(max_processes),
+            "list": asyncio.Semaphore(max_listings),
+            "index": asyncio.Semaphore(max_index_builds),
+        }
+        self.remote_limits = {}
+        self.slots = {}
+        self.binary = binary
+        self.binary_path = None
+
+    def resolve_binary(self):
+        """Look up the rclone executable once and remember its path"""
+        if not self.binary_path:
+            self.binary_path = shutil.which(self.binary)
+            if not self.binary_path:
+                raise FileNotFoundError(f"rclone executable not found: {self.binary}")
+        return self.binary_path
+
+    async def check(self, timeout=30):
+        """Resolve rclone and run it once, returning its version line"""
+        returncode, stdout, stderr = await self.run(["version"], timeout=timeout, pool="list")
+        if returncode != 0:
+            raise RuntimeError(f"rclone version failed: {stderr.strip()[:200]}")
+        return stdout.splitlines()[0] if stdout else "rclone"
+
+    @asynccontextmanager
+    async def _slot(self, config_path, remote, pool):
+        """Acquire a process slot in the pool, and for transfers one per remote"""
+        semaphores = [self.pools[pool]]
+        if pool == "transfer" and remote is not None:
+            key = (str(config_path), remote)
+            semaphores.append(self.remote_limits.setdefault(key, asyncio.Semaphore(self.max_per_remote)))
+        slot = ProcessSlot(semaphores)
+        await slot.acquire()
+        try:
+            yield slot
+        finally:
+            slot.closed = True
+            slot.release()
+
+    def suspend(self, process):
+        """Give up a stopped process's slots so other calls can run meanwhile"""
+        slot = self.slots.get(process)
+        if slot:
+            slot.release()
+
+    async def resume(self, process):
+        """Wait until a suspended process has its slots back"""
+        slot = self.slots.get(process)
+        if not slot:
+            return
+        async with slot.lock:
+            if not slot.held and not slot.closed:
+                await slot.acquire()
+                # The process may have ended while waiting
+                if slot.closed:
+                    slot.release()
+
+    async def _spawn(self, args, config_path, stdin=None):
+        """Start an rclone child process"""
+        command = [self.resolve_binary(), *args]
+        if config_path:
+            command += ["--config", str(config_path)]
+        return await asyncio.create_subprocess_exec(
+            *command,
+            stdin=stdin,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+
+    async def _kill(self, process):
+        """Kill a child process together with its process group and reap it"""
+        if process.returncode is None:
+            signal_process(process, signal.SIGKILL)
+            await process.wait()
+
+    async def run(self, args, config_path=None, remote=None, timeout=120, pool="transfer"):
+        """
+        Run rclone to completion.
+        Returns (returncode, stdout, stderr) with decoded output.
+        Raises asyncio.TimeoutError if waiting for a slot and running exceed the timeout.
+        """
+        async def execute():
+            async with self._slot(config_path, remote, pool):
+                process = await self._spawn(args, config_path)
+                try:
+                    return process, await process.communicate()
+                except BaseException:
+                    await self._kill(process)
+                    raise
+
+        process, (stdout, stderr) = await asyncio.wait_for(execute(), timeout)
+        return (
+            process.returncode,
+            stdout.decode(errors='replace'),
+            stderr.decode(errors='replace')
+        )
+
+    async def stream(self, args, config_path=None, remote=None, on_line=None, on_spawn=None,
+                     feed=None, timeout=None, pool="transfer"):
+        """
+        Run rclone, awaiting on_line(line) for every output line as it arrives.
+        on_spawn(process) is called once the child is started, e.g. to let a
+        transfer job pause it. If given, feed(stdin) writes the child's input
+        concurrently and stdin is closed when it returns. Returns
+        (returncode, stderr_tail) where stderr_tail holds the last lines of
+        stderr for error reporting.
+        """
+        stderr_tail = []
+
+        async def drain(stream, keep_tail):
+            while True:
+                line = await stream.readline()
+                if not line:
+                    break
+                text = line.decode(errors='replace').strip()
+                if keep_tail:
+                    stderr_tail.append(text)
+                    del stderr_tail[:-20]
+                if on_line and text:
+                    try:
+                        await on_line(text)
+                    except Exception as e:
+                        print(f"Error handling rclone output: {e}")
+
+        async def write_input(stdin):
+            try:
+                await feed(stdin)
+            except (BrokenPipeError, ConnectionResetError):
+                # rclone exited early, its exit code and stderr tell why
+                pass
+            finally:
+                stdin.close()
+
+        async def execute():
+            async with self._slot(config_path, remote, pool) as slot:
+                process = await self._spawn(args, config_path, asyncio.subprocess.PIPE if feed else None)
+                self.slots[process] = slot
+                try:
+                    if on_spawn:
+                        on_spawn(process)
+                    tasks = [drain(process.stdout, False), drain(process.stderr, True), process.wait()]
+                    if feed:
+                        tasks.append(write_input(process.stdin))
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    await self._kill(process)
+                    raise
+                finally:
+                    self.slots.pop(process, None)
+                return process.returncode
+
+        returncode = await asyncio.wait_for(execute(), timeout)
+        return returncode, '\n'.join(stderr_tail)
+
+def signal_process(process, sig):
+    """Send a signal to an rclone child and its process group"""
+    if process.returncode is None:
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+def free_rc_address():
+    """Pick a free local address for an rclone RC server"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+rclone = RcloneRunner()
@@ -0,0 +1,89 @@
+import io
+import tarfile
+import zipfile
+import pytest
+from archive import ArchiveWriter, archive_name, format_for_name
+
+MEMBERS = [("a.txt", b"hello " * 1000), ("dir/b.bin", bytes(range(256)) * 50), ("empty", b"")]
+
+def build(fmt, known_sizes=True):
+    """Feed MEMBERS in small chunks and collect the streamed output"""
+    writer = ArchiveWriter(fmt)
+    output = bytearray()
+    for name, data in MEMBERS:
+        writer.start_member(name, len(data) if known_sizes else None, mtime=1700000000)
+        for start in range(0, len(data), 333):
+            writer.write(data[start:start + 333])
+            output += writer.read_pending()
+        writer.end_member()
+        output += writer.read_pending()
+    writer.close()
+    output += writer.read_pending()
+    return bytes(output)
+
+@pytest.mark.parametrize("known_sizes", [True, False])
+def test_zip_round_trip(known_sizes):
+    with zipfile.ZipFile(io.BytesIO(build("zip", known_sizes))) as archive:
+        assert archive.testzip() is None
+        assert {name: archive.read(name) for name in archive.namelist()} == dict(MEMBERS)
+
+def test_tar_round_trip():
+    with tarfile.open(fileobj=io.BytesIO(build("tar"))) as archive:
+        assert {m.name: archive.extractfile(m).read() for m in archive.getmembers()} == dict(MEMBERS)
+
+def test_tar_zst_round_trip():
+    zstandard = pytest.importorskip("zstandard")
+    data = zstandard.ZstdDecompressor().decompressobj().decompress(build("tar.zst"))
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        assert {m.name: archive.extractfile(m).read() for m in archive.getmembers()} == dict(MEMBERS)
+
+def test_tar_needs_member_sizes():
+    with pytest.raises(ValueError):
+        ArchiveWriter("tar").start_member("a.txt")
+
+def test_tar_rejects_size_changes():
+    writer = ArchiveWriter("tar")
+    writer.start_member("a.txt", 10)
+    writer.write(b"short")
+    with pytest.raises(ValueError):
+        writer.end_member()
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        ArchiveWriter("rar")
+
+def test_archive_names():
+    assert archive_name("backup", "zip") == "backup.zip"
+    assert archive_name("backup.tar", "tar") == "backup.tar"
+    assert archive_name("backup.tar", "tar.zst") == "backup.tar.tar.zst"
+    assert format_for_name("a.tar.zst") == "tar.zst"
+    assert format_for_name("a.tar") == "tar"
+    assert format_for_name("a.zip") == "zip"
+    assert format_for_name("a") == "zip"
+
+def test_archive_to_rclone_streams_local_files(tmp_path, monkeypatch):
+    import asyncio
+    import transfer
+    from rclone_runner import RcloneRunner
+
+    # Stand-in for 'rclone rcat remote:path' writing stdin to a local file
+    fake_rclone = tmp_path / "rclone"
+    fake_rclone.write_text(f'#!/bin/sh\ncat > "{tmp_path}/uploaded"\n')
+    fake_rclone.chmod(0o755)
+    sources = []
+    for name, data in MEMBERS:
+        path = tmp_path / name.replace("/", "_")
+        path.write_bytes(data)
+        sources.append(transfer.file_source(path))
+
+    async def run():
+        monkeypatch.setattr(transfer, "rclone", RcloneRunner(binary=str(fake_rclone)))
+        return await transfer.archive_to_rclone(
+            sources, "out.zip", "zip", "remote", "", None, transfer.ProgressSink()
+        )
+
+    size = asyncio.run(run())
+    uploaded = (tmp_path / "uploaded").read_bytes()
+    assert size == len(uploaded)
+    with zipfile.ZipFile(io.BytesIO(uploaded)) as archive:
+        assert [archive.read(name.replace("/", "_")) for name, _ in MEMBERS] == [data for _, data in MEMBERS]
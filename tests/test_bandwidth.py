@@ -0,0 +1,155 @@
+import time
+import asyncio
+import pytest
+import requests
+import bandwidth
+from bandwidth import BandwidthScheduler, parse_rate, format_rate, parse_schedule
+
+@pytest.mark.parametrize("text, rate", [
+    ("512K", 512 * 1024),
+    ("10M", 10 * 1024 * 1024),
+    ("1.5G", int(1.5 * 1024 ** 3)),
+    ("100B", 100),
+    ("2MiB/s", 2 * 1024 * 1024),
+    ("64", 64 * 1024),
+    ("off", None),
+    ("0", None),
+    ("", None),
+])
+def test_parse_rate(text, rate):
+    assert parse_rate(text) == rate
+
+@pytest.mark.parametrize("text", ["fast", "10X", "-5M"])
+def test_parse_rate_rejects_garbage(text):
+    with pytest.raises(ValueError):
+        parse_rate(text)
+
+def test_format_rate():
+    assert format_rate(None) == "off"
+    assert format_rate(512 * 1024) == "512K"
+    assert format_rate(10 * 1024 * 1024) == "10.0M"
+    assert format_rate(100) == "1K"
+
+def test_parse_schedule_sorts_entries():
+    assert parse_schedule("23:00,off 08:30,512K") == [(8 * 60 + 30, 512 * 1024), (23 * 60, None)]
+    assert parse_schedule("") == []
+
+@pytest.mark.parametrize("text", ["08:00", "8,512K", "24:00,1M", "08:60,1M", "08:00,fast"])
+def test_parse_schedule_rejects_bad_entries(text):
+    with pytest.raises(ValueError):
+        parse_schedule(text)
+
+def test_bad_environment_is_ignored(monkeypatch):
+    monkeypatch.setenv("BWLIMIT", "fast")
+    monkeypatch.setenv("BWLIMIT_SCHEDULE", "08:00")
+    scheduler = BandwidthScheduler()
+    assert scheduler.base_rate is None
+    assert scheduler.schedule == []
+
+def test_global_rate_follows_schedule(monkeypatch):
+    scheduler = BandwidthScheduler()
+    scheduler.base_rate = 100
+    scheduler.schedule = parse_schedule("08:00,1M 20:00,off")
+    at = lambda hour: monkeypatch.setattr(time, "localtime", lambda: time.struct_time((2024, 1, 1, hour, 0, 0, 0, 1, -1)))
+
+    at(12)
+    assert scheduler.global_rate() == 1024 * 1024
+    at(21)
+    assert scheduler.global_rate() is None
+    # Before the first entry the previous day's last entry applies
+    at(3)
+    assert scheduler.global_rate() is None
+
+class FakeJob:
+    def __init__(self, job_id, priority, limit=None):
+        self.id = job_id
+        self.priority = priority
+        self.limit = limit
+        self.paused = False
+        self.stopped = False
+        self.rc_url = None
+
+def test_rebalance_shares_by_priority():
+    async def run():
+        scheduler = BandwidthScheduler()
+        scheduler.base_rate = 1300
+        scheduler.schedule = []
+        interactive, normal, bulk = FakeJob("a", "interactive"), FakeJob("b", "normal"), FakeJob("c", "bulk", limit=50)
+        for job in (interactive, normal, bulk):
+            scheduler.register(job)
+        rates = [scheduler.rate_for(job) for job in (interactive, normal, bulk)]
+
+        interactive.paused = True
+        scheduler.rebalance()
+        rates_paused = [scheduler.rate_for(job) for job in (interactive, normal, bulk)]
+        for job in (interactive, normal, bulk):
+            scheduler.unregister(job)
+        return rates, rates_paused
+
+    rates, rates_paused = asyncio.run(run())
+    assert rates == [800, 400, 50]
+    assert rates_paused == [None, 1040, 50]
+
+class FakeResponse:
+    def __init__(self, fail):
+        self.fail = fail
+
+    def raise_for_status(self):
+        if self.fail:
+            raise requests.exceptions.HTTPError("500 Server Error")
+
+def test_rate_changes_are_pushed_only_to_running_children(monkeypatch):
+    posts = []
+    failures = []
+
+    def post(url, json, timeout):
+        posts.append((url, json["rate"]))
+        return FakeResponse(bool(failures and failures.pop()))
+
+    monkeypatch.setattr(bandwidth.requests, "post", post)
+    monkeypatch.setattr(bandwidth, "RC_PUSH_ATTEMPTS", 1)
+
+    async def settle(scheduler, job):
+        push = scheduler.pushes.get(job.id)
+        if push:
+            await push
+
+    async def run():
+        scheduler = BandwidthScheduler()
+        scheduler.base_rate = 1000 * 1024
+        scheduler.schedule = []
+        uploading, other = FakeJob("a", "normal"), FakeJob("b", "normal")
+        scheduler.register(uploading)
+        uploading.rc_url = "http://rc/"
+        # Started with the current rate, nothing to push
+        scheduler.started(uploading, scheduler.rate_for(uploading))
+        assert "a" not in scheduler.pushes
+
+        scheduler.register(other)
+        await settle(scheduler, uploading)
+        assert posts == [("http://rc/core/bwlimit", "500K")]
+
+        # Nothing reaches a stopped child, the new share is pushed after SIGCONT
+        uploading.paused = uploading.stopped = True
+        scheduler.rebalance()
+        scheduler.unregister(other)
+        uploading.paused = False
+        scheduler.rebalance()
+        await settle(scheduler, uploading)
+        assert len(posts) == 1
+        uploading.stopped = False
+        scheduler.push(uploading)
+        await settle(scheduler, uploading)
+        assert posts[-1] == ("http://rc/core/bwlimit", "1000K")
+
+        # A failed push is retried by the next rebalance
+        failures.append(True)
+        scheduler.register(other)
+        await settle(scheduler, uploading)
+        assert scheduler.pushed["a"] == 1024 * 1000
+        scheduler.rebalance()
+        await settle(scheduler, uploading)
+        assert posts[-2:] == [("http://rc/core/bwlimit", "500K")] * 2
+        assert scheduler.pushed["a"] == 500 * 1024
+
+    asyncio.run(run())
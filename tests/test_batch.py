@@ -0,0 +1,78 @@
+import io
+import json
+import asyncio
+import argparse
+import pytest
+import batch
+from batch import load_manifest, load_state, save_state, run_batch
+
+def test_text_manifest(tmp_path):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(
+        "# comment\n"
+        "\n"
+        "https://example.com/a.iso gdrive:isos\n"
+        "/data/my file.txt  s3:bucket/docs\n"
+        "https://example.com/a.iso gdrive:isos\n"
+    )
+    units = load_manifest(manifest)
+    assert [(unit["sources"], unit["target"], unit["archive"]) for unit in units] == [
+        (["https://example.com/a.iso"], "gdrive:isos", None),
+        (["/data/my file.txt"], "s3:bucket/docs", None),
+    ]
+
+def test_json_manifest_groups_archives(tmp_path):
+    manifest = tmp_path / "manifest.jsonl"
+    lines = [
+        {"source": "/data/a", "target": "r:x", "archive": "pack.zip"},
+        {"source": "/data/b", "target": "r:x", "archive": "pack.zip"},
+        {"source": "/data/a", "target": "r:x", "archive": "pack.zip"},
+        {"source": "/data/a", "target": "r:y", "archive": "pack.zip"},
+        {"source": "/data/a", "target": "r:x"},
+    ]
+    manifest.write_text("\n".join(json.dumps(line) for line in lines))
+    units = load_manifest(manifest)
+    assert [(unit["key"], unit["sources"]) for unit in units] == [
+        (("pack.zip", "r:x"), ["/data/a", "/data/b"]),
+        (("pack.zip", "r:y"), ["/data/a"]),
+        (("/data/a", "r:x"), ["/data/a"]),
+    ]
+
+@pytest.mark.parametrize("line", ["just-a-source", "source not-a-remote", '{"source": "x"}'])
+def test_invalid_manifest_lines(tmp_path, line):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(line + "\n")
+    with pytest.raises(ValueError):
+        load_manifest(manifest)
+
+def test_state_round_trip(tmp_path):
+    state = tmp_path / "state.json"
+    assert load_state(str(state)) == set()
+    save_state(str(state), {("a", "r:x"), ("pack.zip", "r:y")})
+    assert load_state(str(state)) == {("a", "r:x"), ("pack.zip", "r:y")}
+
+def test_rerun_skips_completed_entries(tmp_path, monkeypatch):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("/data/a r:x\n/data/b r:x\n")
+    state = tmp_path / "state.json"
+    save_state(str(state), {("/data/a", "r:x")})
+
+    transferred = []
+    async def fake_transfer(entry, args, sink, job):
+        transferred.append(entry["sources"][0])
+        sink.size = 10
+        return True
+    monkeypatch.setattr(batch, "transfer_entry", fake_transfer)
+
+    args = argparse.Namespace(state=str(state), jobs=2, json=True, bwlimit=None, job_bwlimit=None)
+    out = io.StringIO()
+    assert asyncio.run(run_batch(load_manifest(manifest), args, out)) == 0
+    assert transferred == ["/data/b"]
+    summary = json.loads(out.getvalue().splitlines()[-1])
+    assert (summary["ok"], summary["skipped"], summary["bytes"]) == (1, 1, 10)
+    assert load_state(str(state)) == {("/data/a", "r:x"), ("/data/b", "r:x")}
+
+def test_bad_manifest_is_a_usage_error(tmp_path):
+    with pytest.raises(SystemExit) as error:
+        batch.main([str(tmp_path / "missing.txt")])
+    assert error.value.code == 2
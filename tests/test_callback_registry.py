@@ -0,0 +1,26 @@
+from callback_registry import CallbackRegistry
+
+def test_tokens_map_to_exact_locations():
+    registry = CallbackRegistry()
+    token = registry.register(1, "gdrive", "Movies/2024: The Best/ünïcode")
+    assert len(f"nav_{token}".encode()) <= 64
+    assert registry.resolve(1, token) == ("gdrive", "Movies/2024: The Best/ünïcode")
+    assert registry.register(1, "gdrive", "Movies/2024: The Best/ünïcode") == token
+    # Tokens are per user
+    assert registry.resolve(2, token) is None
+
+def test_least_recently_used_tokens_are_evicted():
+    registry = CallbackRegistry(max_entries=2)
+    first = registry.register(1, "r", "a")
+    second = registry.register(1, "r", "b")
+    registry.resolve(1, first)
+    third = registry.register(1, "r", "c")
+    assert registry.resolve(1, second) is None
+    assert registry.resolve(1, first) == ("r", "a")
+    assert registry.resolve(1, third) == ("r", "c")
+
+def test_clear_drops_a_users_tokens():
+    registry = CallbackRegistry()
+    token = registry.register(1, "r", "a")
+    registry.clear(1)
+    assert registry.resolve(1, token) is None
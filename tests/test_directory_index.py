@@ -0,0 +1,85 @@
+import time
+import asyncio
+import directory_index
+from directory_index import DirectoryIndex, DestinationHistory
+
+def make_index(monkeypatch, tmp_path, dirs):
+    monkeypatch.chdir(tmp_path)
+    index = DirectoryIndex()
+    index.trees[(1, "r")] = {"built": time.time(), "dirs": set(dirs)}
+    return index
+
+def test_update_merges_a_listing_and_drops_removed_subtrees(monkeypatch, tmp_path):
+    index = make_index(monkeypatch, tmp_path, ["a", "a/old", "a/old/deep", "a/keep", "b"])
+    index.update(1, "r", "a", ["keep", "new"])
+    assert index.trees[(1, "r")]["dirs"] == {"a", "a/keep", "a/new", "b"}
+
+    # The merged index is written to disk and reloads identically
+    reloaded = DirectoryIndex()
+    assert reloaded._load(1, "r")["dirs"] == {"a", "a/keep", "a/new", "b"}
+
+def test_update_at_root_and_without_an_index(monkeypatch, tmp_path):
+    index = make_index(monkeypatch, tmp_path, ["a", "a/x", "b"])
+    index.update(1, "r", "", ["a"])
+    assert index.trees[(1, "r")]["dirs"] == {"a", "a/x"}
+
+    index.update(1, "missing", "", ["a"])
+    assert (1, "missing") not in index.trees
+
+def test_search_ranks_exact_then_prefix_then_substring_then_path(monkeypatch, tmp_path):
+    index = make_index(monkeypatch, tmp_path, [
+        "Media/Photos 2020",
+        "Backup/photos",
+        "Old/MyPhotos",
+        "Photos/Trips",
+        "Docs",
+    ])
+    assert index.search(1, " PHOTOS ", ["r"]) == [
+        ("r", "Backup/photos"),
+        ("r", "Media/Photos 2020"),
+        ("r", "Old/MyPhotos"),
+        ("r", "Photos/Trips"),
+    ]
+    assert index.search(1, "photos", ["r"], limit=1) == [("r", "Backup/photos")]
+    assert index.search(1, "photos", ["other"]) == []
+
+def test_invalidate_forgets_trees_and_files(monkeypatch, tmp_path):
+    index = make_index(monkeypatch, tmp_path, ["a"])
+    index._save(1, "r")
+    index.invalidate(1)
+    assert (1, "r") not in index.trees
+    assert not (tmp_path / "config" / "1" / "index").exists()
+
+def test_destination_history_suggests_recent_and_frequent(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    history = DestinationHistory()
+    for _ in range(3):
+        history.record(1, "r", "often")
+    history.record(1, "r", "once")
+    assert history.suggestions(1, limit=1) == [("r", "once"), ("r", "often")]
+    assert DestinationHistory().suggestions(1) == [("r", "once"), ("r", "often")]
+
+def test_invalidate_cancels_running_builds(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+    class SlowRclone:
+        async def run(self, args, **kwargs):
+            await asyncio.sleep(60)
+            return 0, '[{"Path": "stale"}]', ""
+
+    monkeypatch.setattr(directory_index, "rclone", SlowRclone())
+    index = directory_index.DirectoryIndex()
+
+    async def run():
+        index.refresh(1, ["r"])
+        task = index.tasks[(1, "r")]
+        await asyncio.sleep(0)
+        assert index.is_building(1)
+        index.invalidate(1)
+        await asyncio.gather(task, return_exceptions=True)
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert index.tasks == {}
+    assert index._load(1, "r") is None
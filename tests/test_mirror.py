@@ -0,0 +1,161 @@
+import asyncio
+from pathlib import Path
+import pytest
+from mirror import MirrorWatcher, parse_interval, format_interval
+
+def entry(path, size=1, modtime="2024-01-01T00:00:00Z", md5=None):
+    return {"Path": path, "Size": size, "ModTime": modtime, "Hashes": {"md5": md5} if md5 else {}}
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+
+    async def send_document(self, chat_id, file_id, caption=None):
+        self.sent.append((chat_id, file_id, caption))
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, None, text))
+
+def make_watcher(monkeypatch, tmp_path, listing):
+    """Watcher whose listings come from the list and whose uploads are recorded"""
+    monkeypatch.chdir(tmp_path)
+    uploads = []
+    failing = set()
+
+    async def list_files(user_id, remote, path):
+        return listing
+
+    watcher = MirrorWatcher(FakeClient(), list_files, None)
+
+    async def transfer(mirror, path, info, caption, job):
+        await asyncio.sleep(0)
+        uploads.append(path)
+        return None if path in failing else f"id-{path}"
+
+    monkeypatch.setattr(watcher, "_transfer", transfer)
+    return watcher, uploads, failing
+
+def make_mirror(watcher, listing):
+    return {
+        "id": "m1", "user_id": 1, "chat_id": 10, "remote": "r", "path": "dir",
+        "interval": 60, "last_poll": 0,
+        "snapshot": {e["Path"]: watcher._entry_info(e) for e in listing}
+    }
+
+@pytest.mark.parametrize("text, seconds", [("90s", 90), ("15m", 900), ("15", 900), ("2h", 7200), ("1d", 86400)])
+def test_parse_interval(text, seconds):
+    assert parse_interval(text) == seconds
+
+def test_parse_interval_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_interval("15min")
+
+def test_format_interval():
+    assert [format_interval(s) for s in (90, 900, 7200, 86400)] == ["90s", "15m", "2h", "1d"]
+
+def test_poll_posts_new_and_changed_files(monkeypatch, tmp_path):
+    listing = []
+    watcher, uploads, failing = make_watcher(monkeypatch, tmp_path, listing)
+    mirror = make_mirror(watcher, [entry("same"), entry("changed"), entry("gone"), entry("rehashed", md5="a")])
+    listing += [
+        entry("same"),
+        entry("changed", modtime="2024-02-01T00:00:00Z"),
+        entry("rehashed", modtime="2024-02-01T00:00:00Z", md5="a"),
+        entry("new"),
+        entry("broken"),
+    ]
+    failing.add("broken")
+
+    asyncio.run(watcher.poll(mirror))
+    assert sorted(uploads) == ["broken", "changed", "new"]
+    assert sorted(mirror["snapshot"]) == ["changed", "new", "rehashed", "same"]
+
+    # Failed files are retried on the next poll
+    failing.clear()
+    asyncio.run(watcher.poll(mirror))
+    assert sorted(uploads) == ["broken", "broken", "changed", "new"]
+    assert "broken" in mirror["snapshot"]
+
+def test_known_content_is_resent_by_file_id(monkeypatch, tmp_path):
+    listing = [entry("first", md5="abc")]
+    watcher, uploads, _ = make_watcher(monkeypatch, tmp_path, listing)
+    mirror = make_mirror(watcher, [])
+
+    asyncio.run(watcher.poll(mirror))
+    assert uploads == ["first"]
+
+    # The same content under another name is not uploaded again
+    listing.append(entry("copy", md5="abc"))
+    asyncio.run(watcher.poll(mirror))
+    assert uploads == ["first"]
+    assert watcher.client.sent == [(10, "id-first", "🪞 r:dir/copy")]
+
+def test_files_too_large_for_telegram_are_announced(monkeypatch, tmp_path):
+    listing = [entry("huge", size=3 * 1024 ** 3)]
+    watcher, uploads, _ = make_watcher(monkeypatch, tmp_path, listing)
+    mirror = make_mirror(watcher, [])
+
+    asyncio.run(watcher.poll(mirror))
+    assert uploads == []
+    assert "huge" in mirror["snapshot"]
+    assert watcher.client.sent[0][2].startswith("⚠️ Too large for Telegram")
+
+def test_identical_files_in_one_poll_are_uploaded_once(monkeypatch, tmp_path):
+    listing = [entry("a", md5="abc"), entry("b", md5="abc"), entry("c", md5="abc")]
+    watcher, uploads, _ = make_watcher(monkeypatch, tmp_path, listing)
+    mirror = make_mirror(watcher, [])
+
+    asyncio.run(watcher.poll(mirror))
+    assert len(uploads) == 1
+    assert sorted(file_id for _, file_id, _ in watcher.client.sent) == [f"id-{uploads[0]}"] * 2
+    assert sorted(mirror["snapshot"]) == ["a", "b", "c"]
+    assert watcher.uploads == {}
+
+@pytest.mark.parametrize("interval, max_sends, expected_interval, expected_sends", [
+    ("2h", "4", 7200, 4),
+    ("15min", "many", 900, 2),
+    ("5s", "0", 60, 2),
+])
+def test_settings_come_from_the_environment(monkeypatch, interval, max_sends, expected_interval, expected_sends):
+    monkeypatch.setenv("MIRROR_INTERVAL", interval)
+    monkeypatch.setenv("MIRROR_MAX_SENDS", max_sends)
+    watcher = MirrorWatcher(FakeClient(), None, None)
+    assert watcher.default_interval == expected_interval
+    assert watcher.send_limit._value == expected_sends
+
+def test_files_are_copied_into_the_jobs_staging_folder(monkeypatch, tmp_path):
+    import mirror as mirror_module
+    from rclone_runner import RcloneRunner
+
+    # Stand-in for 'rclone copyto src dst' that logs its arguments
+    fake_rclone = tmp_path / "rclone"
+    fake_rclone.write_text(f'#!/bin/sh\necho "$@" > "{tmp_path}/args"\necho content > "$3"\n')
+    fake_rclone.chmod(0o755)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(mirror_module.bandwidth, "base_rate", 1024 * 1024)
+    monkeypatch.setattr(mirror_module.bandwidth, "schedule", [])
+    staged = []
+
+    async def list_files(user_id, remote, path):
+        return [entry("sub/file.txt")]
+
+    async def send_file(chat_id, file_path, job, caption, file_name):
+        staged.append((file_path, file_path.read_text(), file_name))
+        return "file-id"
+
+    async def run():
+        monkeypatch.setattr(mirror_module, "rclone", RcloneRunner(binary=str(fake_rclone)))
+        watcher = MirrorWatcher(FakeClient(), list_files, send_file)
+        watched = make_mirror(watcher, [])
+        await watcher.poll(watched)
+        return watched
+
+    watched = asyncio.run(run())
+    file_path, content, file_name = staged[0]
+    assert file_path.parent.parent == Path("downloads") / "1" / "mirror"
+    assert (content, file_name) == ("content\n", "file.txt")
+    assert not file_path.parent.exists()
+    args = (tmp_path / "args").read_text().split()
+    assert args[:2] == ["copyto", "r:dir/sub/file.txt"]
+    assert args[3:5] == ["--bwlimit", "1.0M"]
+    assert "sub/file.txt" in watched["snapshot"]
@@ -0,0 +1,84 @@
+import os
+from rclone_config import RcloneConfig, RcloneConfigCache, DEFAULT_CAPABILITIES
+
+CONFIG = """
+[gdrive]
+type = drive
+scope = drive
+
+[secret]
+type = crypt
+remote = gdrive:encrypted
+
+[shortcut]
+type = alias
+remote = gdrive:some/folder
+
+[loop1]
+type = alias
+remote = loop2:
+
+[loop2]
+type = alias
+remote = loop1:
+
+[disk]
+type = local
+
+[odd]
+type = something-new
+"""
+
+def write_config(tmp_path, text=CONFIG):
+    path = tmp_path / "rclone.conf"
+    path.write_text(text)
+    return path
+
+def test_parse_keeps_remote_order(tmp_path):
+    config = RcloneConfig.parse(write_config(tmp_path), version=None)
+    assert config.remote_names() == ["gdrive", "secret", "shortcut", "loop1", "loop2", "disk", "odd"]
+    assert config.backend("secret") == "crypt"
+    assert config.backend("missing") is None
+
+def test_wrapper_capabilities(tmp_path):
+    config = RcloneConfig.parse(write_config(tmp_path), version=None)
+    drive = config.capabilities("gdrive")
+    assert drive["stored_hashes"] and "md5" in drive["hashes"]
+
+    # crypt inherits the wrapped remote's features but not its hashes
+    secret = config.capabilities("secret")
+    assert secret["hashes"] == [] and not secret["stored_hashes"]
+    assert secret["stream_upload"] == drive["stream_upload"]
+    assert config.capabilities("shortcut") == drive
+
+    # Local hashes exist but are computed by reading the files
+    assert config.capabilities("disk")["hashes"] and not config.capabilities("disk")["stored_hashes"]
+
+def test_unknown_and_cyclic_remotes(tmp_path):
+    config = RcloneConfig.parse(write_config(tmp_path), version=None)
+    assert config.capabilities("odd") == DEFAULT_CAPABILITIES
+    assert config.capabilities("loop1") == DEFAULT_CAPABILITIES
+
+def test_encrypted_config(tmp_path):
+    path = write_config(tmp_path, "# Encrypted rclone configuration File\n\nRCLONE_ENCRYPT_V0:\nabc\n")
+    config = RcloneConfig.parse(path, version=None)
+    assert config.encrypted and config.remote_names() == []
+
+def test_cache_reparses_only_on_change(tmp_path):
+    path = write_config(tmp_path)
+    cache = RcloneConfigCache()
+    first = cache.get(path)
+    assert cache.get(path) is first
+
+    path.write_text("[other]\ntype = s3\n")
+    os.utime(path, ns=(1, 1))
+    second = cache.get(path)
+    assert second is not first and second.remote_names() == ["other"]
+
+    cache.invalidate(path)
+    assert cache.get(path) is not second
+
+def test_cache_missing_or_broken_config(tmp_path):
+    cache = RcloneConfigCache()
+    assert cache.get(tmp_path / "missing.conf") is None
+    assert cache.get(write_config(tmp_path, "not an ini file")) is None
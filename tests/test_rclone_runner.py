@@ -0,0 +1,117 @@
+import os
+import asyncio
+import pytest
+from rclone_runner import RcloneRunner
+
+FAKE_RCLONE = """#!/bin/sh
+# Stand-in for rclone: "sleep N" records its pid and sleeps, anything else echoes
+if [ "$1" = "sleep" ]; then
+    echo $$ > "$(dirname "$0")/pid"
+    exec sleep "$2"
+fi
+echo "$@"
+echo "done" >&2
+"""
+
+@pytest.fixture
+def fake_rclone(tmp_path):
+    path = tmp_path / "rclone"
+    path.write_text(FAKE_RCLONE)
+    path.chmod(0o755)
+    return path
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+async def wait_for_pid(path):
+    while not path.exists() or not path.read_text().strip():
+        await asyncio.sleep(0.01)
+    return int(path.read_text())
+
+def test_run_returns_decoded_output(fake_rclone):
+    async def run():
+        runner = RcloneRunner(binary=str(fake_rclone))
+        return await runner.run(["lsd", "remote:"], config_path="rclone.conf", pool="list")
+
+    returncode, stdout, stderr = asyncio.run(run())
+    assert returncode == 0
+    assert stdout.strip() == "lsd remote: --config rclone.conf"
+    assert stderr.strip() == "done"
+
+def test_timeout_includes_waiting_for_a_slot(fake_rclone):
+    async def run():
+        runner = RcloneRunner(max_processes=1, binary=str(fake_rclone))
+        busy = asyncio.create_task(runner.run(["sleep", "30"], timeout=None))
+        await wait_for_pid(fake_rclone.parent / "pid")
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await runner.run(["lsd", "remote:"], timeout=0.2)
+        waited = loop.time() - started
+        busy.cancel()
+        await asyncio.gather(busy, return_exceptions=True)
+        return waited
+
+    assert asyncio.run(run()) < 5
+
+def test_cancel_kills_the_process(fake_rclone):
+    async def run():
+        runner = RcloneRunner(max_processes=2, binary=str(fake_rclone))
+        task = asyncio.create_task(runner.run(["sleep", "30"], timeout=None))
+        pid = await wait_for_pid(fake_rclone.parent / "pid")
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return pid, runner.pools["transfer"]._value
+
+    pid, free_slots = asyncio.run(run())
+    assert not process_exists(pid)
+    assert free_slots == 2
+
+def test_listings_are_not_blocked_by_transfers(fake_rclone):
+    async def run():
+        runner = RcloneRunner(max_processes=1, binary=str(fake_rclone))
+        busy = asyncio.create_task(runner.stream(["sleep", "30"]))
+        await wait_for_pid(fake_rclone.parent / "pid")
+        result = await runner.run(["lsd", "remote:"], timeout=5, pool="list")
+        busy.cancel()
+        await asyncio.gather(busy, return_exceptions=True)
+        return result
+
+    returncode, stdout, _ = asyncio.run(run())
+    assert returncode == 0
+    assert stdout.strip() == "lsd remote:"
+
+def test_missing_binary_is_reported(tmp_path):
+    runner = RcloneRunner(binary=str(tmp_path / "missing"))
+    with pytest.raises(FileNotFoundError):
+        runner.resolve_binary()
+
+def test_paused_jobs_give_their_slot_back(fake_rclone, monkeypatch):
+    import transfer
+
+    async def run():
+        runner = RcloneRunner(max_processes=1, binary=str(fake_rclone))
+        monkeypatch.setattr(transfer, "rclone", runner)
+        job = transfer.TransferJob(1)
+        paused = asyncio.create_task(runner.stream(["sleep", "30"], on_spawn=job.attach))
+        await wait_for_pid(fake_rclone.parent / "pid")
+
+        job.pause()
+        returncode, _, _ = await runner.run(["lsd", "remote:"], timeout=5)
+        assert returncode == 0
+
+        # Resuming waits for the slot again before continuing the child
+        job.resume()
+        await job._continuing
+        assert runner.pools["transfer"]._value == 0
+        assert runner.slots[job.process].held
+
+        paused.cancel()
+        await asyncio.gather(paused, return_exceptions=True)
+        return runner.pools["transfer"]._value
+
+    assert asyncio.run(run()) == 1
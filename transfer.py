@@ -0,0 +1,596 @@
+import re
+import time
+import uuid
+import signal
+import secrets
+import shutil
+import asyncio
+import requests
+from requests.adapters import HTTPAdapter
+from pathlib import Path
+from rclone_runner import rclone, signal_process, free_rc_address
+from rclone_config import rclone_configs
+from bandwidth import bandwidth, format_rate
+from archive import ArchiveWriter
+
+# Running transfers by job id
+transfer_jobs = {}
+
+# Shared HTTP session so URL transfers reuse pooled keep-alive connections
+_http_session = None
+
+# Attempts at starting rclone when its RC port was taken before it could bind it
+RC_BIND_ATTEMPTS = 3
+
+# Connect and read timeouts of HTTP requests in seconds
+HTTP_TIMEOUT = (10, 60)
+
+def http_session():
+    """Return the shared requests session, creating it on first use"""
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+        _http_session.mount("http://", adapter)
+        _http_session.mount("https://", adapter)
+    return _http_session
+
+async def http_get(url, **kwargs):
+    """Open a streaming GET request in a worker thread so a slow server can't block the event loop"""
+    return await asyncio.to_thread(http_session().get, url, stream=True, timeout=HTTP_TIMEOUT, **kwargs)
+
+async def iter_response(response, chunk_size=64 * 1024):
+    """
+    Yield the body of a streaming response, reading each chunk in a worker thread.
+    The response is closed when iteration ends or is cancelled, which also
+    aborts a read still blocked in its thread.
+    """
+    chunks = response.iter_content(chunk_size=chunk_size)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            if chunk:
+                yield chunk
+    finally:
+        response.close()
+
+# ========== File Transfer Utilities ==========
+def format_size(size):
+    """Convert bytes to human readable format"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def format_speed(bytes_per_second):
+    """Convert bytes per second to human readable format"""
+    speed = bytes_per_second
+    for unit in ['B/s', 'KB/s', 'MB/s', 'GB/s']:
+        if speed < 1024:
+            return f"{speed:.1f} {unit}"
+        speed /= 1024
+    return f"{speed:.1f} GB/s"
+
+def create_progress_bar(percent, width=20):
+    """Create a visual progress bar"""
+    filled = int(width * percent / 100)
+    bar = '█' * filled + '░' * (width - filled)
+    return bar
+
+# Helper function to convert units to bytes for consistent tracking
+def convert_to_bytes(value, unit):
+    """Convert a value with unit to bytes"""
+    multiplier = 1
+    unit = unit.strip().upper()
+
+    if unit.startswith('K'):
+        multiplier = 1024
+    elif unit.startswith('M'):
+        multiplier = 1024 * 1024
+    elif unit.startswith('G'):
+        multiplier = 1024 * 1024 * 1024
+    elif unit.startswith('T'):
+        multiplier = 1024 * 1024 * 1024 * 1024
+
+    return int(value * multiplier)
+
+# ========== Progress Sinks ==========
+class ProgressSink:
+    """
+    Receives the progress of a transfer.
+    The engine reports through this interface only, so the same pipeline
+    can drive a Telegram status message, a terminal or a JSON log.
+    """
+    async def status(self, text):
+        """Report an intermediate stage of the transfer"""
+
+    async def progress(self, stage, name, current, total, speed, eta=None, target=None):
+        """Report transferred bytes; stage is 'download' or 'upload'"""
+
+    async def finish(self, ok, text):
+        """Report the final outcome of the transfer"""
+
+# ========== Transfer Jobs ==========
+class TransferJob:
+    """
+    Handle for a running transfer that can be paused, resumed or cancelled.
+    Transfer loops call checkpoint() between chunks; rclone children are
+    paused with SIGSTOP/SIGCONT and killed by the runner on cancellation.
+    The bandwidth scheduler shares the uplink between jobs by priority.
+    """
+    def __init__(self, user_id, limit=None):
+        self.id = secrets.token_hex(4)
+        self.user_id = user_id
+        self.task = None
+        self.process = None
+        self.staging = set()
+        self.staging_dirs = set()
+        self.priority = "normal"
+        self.limit = limit
+        self.rc_url = None
+        self.stopped = False
+        self._progress = 0
+        self._continuing = None
+        self._running = asyncio.Event()
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def start(self, coro, sink):
+        """Run the transfer coroutine as a background task"""
+        transfer_jobs[self.id] = self
+        bandwidth.register(self)
+        self.task = asyncio.create_task(self._run(coro, sink))
+        return self.task
+
+    async def _run(self, coro, sink):
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            await sink.finish(False, "❌ Transfer cancelled")
+        finally:
+            self.cleanup()
+            transfer_jobs.pop(self.id, None)
+            bandwidth.unregister(self)
+
+    async def checkpoint(self):
+        """Yield to the event loop and wait while the job is paused"""
+        await asyncio.sleep(0)
+        await self._running.wait()
+
+    async def progress_checkpoint(self, current, total):
+        """Progress callback for Pyrogram transfers honouring pause and bandwidth limits"""
+        await self.checkpoint()
+        if current < self._progress:
+            self._progress = 0
+        await bandwidth.throttle(self, current - self._progress)
+        self._progress = current
+
+    def attach(self, process, rc_address=None, rate=None):
+        """Track the rclone child, started with --bwlimit rate, so it can be paused and re-limited"""
+        self.process = process
+        self.rc_url = f"http://{rc_address}/" if rc_address else None
+        if self.paused:
+            signal_process(process, signal.SIGSTOP)
+            rclone.suspend(process)
+            self.stopped = True
+        if self.rc_url:
+            bandwidth.started(self, rate)
+
+    def detach(self):
+        """Forget the rclone child once it has exited"""
+        self.process = None
+        self.rc_url = None
+        self.stopped = False
+
+    def track(self, *paths):
+        """Register staging files to delete once the job ends"""
+        self.staging.update(paths)
+
+    def staging_dir(self, base):
+        """Create a staging folder of the job's own below base, removed once the job ends"""
+        path = Path(base) / self.id
+        path.mkdir(parents=True, exist_ok=True)
+        self.staging_dirs.add(path)
+        return path
+
+    def pause(self):
+        self._running.clear()
+        if self.process:
+            signal_process(self.process, signal.SIGSTOP)
+            # A stopped child doesn't count against the runner's process limits
+            rclone.suspend(self.process)
+            self.stopped = True
+        bandwidth.rebalance()
+
+    def resume(self):
+        self._running.set()
+        if self.process:
+            self._continuing = asyncio.create_task(self._continue(self.process))
+        bandwidth.rebalance()
+
+    async def _continue(self, process):
+        """Continue a stopped rclone child once it has its runner slots back"""
+        await rclone.resume(process)
+        if self.paused:
+            rclone.suspend(process)
+        else:
+            signal_process(process, signal.SIGCONT)
+            self.stopped = False
+            # Limit changes were held back while the child was stopped
+            bandwidth.push(self)
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+
+    def cleanup(self):
+        """Free the staging space used by the job"""
+        if self._continuing:
+            self._continuing.cancel()
+        for path in self.staging:
+            try:
+                if path.exists():
+                    path.unlink()
+                    print(f"Deleted file: {path}")
+            except Exception as e:
+                print(f"Error deleting file {path}: {e}")
+        for path in self.staging_dirs:
+            try:
+                shutil.rmtree(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error deleting folder {path}: {e}")
+
+# ========== Transfer Pipeline ==========
+def get_url_file_name(url):
+    """Work out a clean file name for a URL download"""
+    # Improved filename extraction with content-disposition header
+    response = http_session().head(url, timeout=HTTP_TIMEOUT)
+    if 'Content-Disposition' in response.headers:
+        # Try to get filename from content-disposition header
+        cd = response.headers['Content-Disposition']
+        filename_match = re.search(r'filename="?([^"]+)"?', cd)
+        if filename_match:
+            file_name = filename_match.group(1)
+        else:
+            file_name = url.split("/")[-1].split("?")[0]
+    else:
+        # Fallback to URL-based extraction
+        file_name = url.split("/")[-1].split("?")[0]
+
+    # Clean filename of any invalid characters
+    file_name = re.sub(r'[\\/*?:"<>|]', "_", file_name)
+
+    # If filename is still problematic, generate a random one with extension
+    if not file_name or file_name == "" or len(file_name) < 3:
+        extension = url.split(".")[-1] if "." in url.split("/")[-1] else "bin"
+        if extension.find("?") > 0:
+            extension = extension.split("?")[0]
+        file_name = f"download_{uuid.uuid4().hex}.{extension}"
+    return file_name
+
+async def download_file_from_url(url, download_dir, sink, job=None):
+    """
+    Download a file from URL with progress tracking
+    Returns path of downloaded file if successful, None if failed
+    """
+    download_path = None
+    try:
+        # Setup download directory, one per job so transfers of the same URL or
+        # equally named files don't share a staging file
+        download_dir = Path(download_dir)
+        if job:
+            download_dir = job.staging_dir(download_dir)
+        download_dir.mkdir(parents=True, exist_ok=True)
+
+        file_name = await asyncio.to_thread(get_url_file_name, url)
+        download_path = download_dir / file_name
+        if job:
+            job.track(download_path)
+
+        # Start download with progress tracking
+        response = await http_get(url)
+        response.raise_for_status()
+        total_size = int(response.headers.get('content-length', 0))
+        if job:
+            bandwidth.assign(job, total_size)
+
+        with open(download_path, 'wb') as f:
+            downloaded = 0
+            last_update_time = time.time()
+            last_downloaded = 0
+            reconnects = 0
+
+            while True:
+                try:
+                    async for chunk in iter_response(response):
+                        if job:
+                            await job.checkpoint()
+                            await bandwidth.throttle(job, len(chunk))
+                        f.write(chunk)
+                        downloaded += len(chunk)
+
+                        # Update progress every 0.5 seconds
+                        current_time = time.time()
+                        time_diff = current_time - last_update_time
+
+                        if time_diff >= 0.5 and total_size:
+                            bytes_per_second = (downloaded - last_downloaded) / time_diff
+                            await sink.progress("download", file_name, downloaded, total_size, bytes_per_second)
+
+                            # Update tracking variables
+                            last_update_time = current_time
+                            last_downloaded = downloaded
+                    break
+                except requests.exceptions.RequestException:
+                    # Connection dropped (e.g. while paused): continue from the
+                    # last written byte if the server supports range requests
+                    if reconnects >= 3 or not total_size:
+                        raise
+                    reconnects += 1
+                    response = await http_get(url, headers={'Range': f'bytes={downloaded}-'})
+                    if response.status_code != 206:
+                        raise
+
+        await sink.status(f"✅ Download completed: {file_name}\nStarting upload...")
+        return download_path
+
+    except Exception as e:
+        await sink.finish(False, f"❌ Download failed: {str(e)[:1000]}")
+        # Remove just the partial file, other transfers may share the folder
+        if download_path and download_path.exists():
+            download_path.unlink()
+        return None
+
+async def upload_to_rclone(download_path, remote, path, config_path, sink, job=None, cleanup=True):
+    """
+    Upload a local file to rclone remote storage with consistent progress tracking
+    The file is deleted afterwards unless cleanup is False
+    Returns True if successful, False if failed
+    """
+    try:
+        # Setup paths
+        file_name = download_path.name
+        remote_path = f"{remote}:{path}/{file_name}" if path else f"{remote}:{file_name}"
+
+        # Get actual file size before upload for more accurate progress tracking
+        local_file_size = download_path.stat().st_size
+        formatted_file_size = format_size(local_file_size)
+
+        # Start upload with improved progress tracking
+        await sink.status(
+            f"📤 Preparing to upload to {remote}\n"
+            f"📄 File: {file_name}\n"
+            f"📦 Size: {formatted_file_size}\n"
+            f"⏱️ Calculating transfer details..."
+        )
+
+        # Variables to track progress
+        last_update = 0
+        confirmed_size = 0
+
+        async def on_line(data):
+            nonlocal last_update, confirmed_size
+            if "Transferred:" not in data:
+                return
+            match = re.search(
+                r"Transferred:\s+([\d.]+\s*\w+)\s+/\s+([\d.]+\s*\w+),\s+([\d.]+%)\s*,\s+([\d.]+\s*\w+/s),\s+ETA\s+([\w\s]+)",
+                data
+            )
+
+            if match and (current_time := asyncio.get_event_loop().time()) - last_update >= 1:
+                transferred, reported_total, percentage, speed, eta = match.groups()
+
+                # Convert transferred to bytes for consistency check
+                transferred_value = float(transferred.split()[0])
+                transferred_unit = transferred.split()[1]
+                transferred_bytes = convert_to_bytes(transferred_value, transferred_unit)
+
+                # Use local_file_size for consistency in progress calculation
+                if transferred_bytes > confirmed_size:
+                    confirmed_size = transferred_bytes
+
+                speed_value, speed_unit = re.match(r"([\d.]+)\s*(\S+)", speed).groups()
+                await sink.progress(
+                    "upload", file_name, min(confirmed_size, local_file_size), local_file_size,
+                    convert_to_bytes(float(speed_value), speed_unit), eta=eta.strip(), target=remote
+                )
+                last_update = current_time
+
+        args = [
+            "copy",
+            str(download_path),
+            remote_path,
+            "--progress",
+            "--stats", "1s",
+            "--no-check-certificate",  # Add if having SSL verification issues
+            "-v",
+        ]
+
+        # Apply the scheduled bandwidth share
+        if job:
+            bandwidth.assign(job, local_file_size)
+            rate = bandwidth.rate_for(job)
+            if rate:
+                args += ["--bwlimit", format_rate(rate)]
+
+        # Run rclone, streaming its output into the progress display. Jobs
+        # expose the RC server so the scheduler can change the limit while the
+        # copy runs; core/bwlimit needs no auth, so the RC stays authenticated.
+        # The RC port is picked before rclone binds it, so retry if it got taken.
+        for _ in range(RC_BIND_ATTEMPTS):
+            command, on_spawn = args, None
+            if job:
+                rc_address = free_rc_address()
+                command = args + ["--rc", "--rc-addr", rc_address]
+                on_spawn = lambda process, rc_address=rc_address: job.attach(process, rc_address, rate)
+            try:
+                returncode, stderr = await rclone.stream(
+                    command, config_path=config_path, remote=remote, on_line=on_line, on_spawn=on_spawn
+                )
+            finally:
+                if job:
+                    job.detach()
+            if not (job and returncode != 0 and "address already in use" in stderr):
+                break
+
+        if returncode == 0:
+            await sink.finish(
+                True,
+                f"✅ Successfully uploaded to `{remote_path}`\n"
+                f"📄 **File:** `{file_name}`\n"
+                f"📦 **Size:** `{formatted_file_size}`"
+            )
+            return True
+        else:
+            error_details = '\n'.join(stderr.splitlines()[-5:])
+            await sink.finish(
+                False,
+                f"❌ Upload failed with error code {returncode}\n\n"
+                f"Error details:\n{error_details}"
+            )
+            return False
+
+    except Exception as e:
+        await sink.finish(False, f"❌ Upload failed: {str(e)[:1000]}")
+        return False
+
+    finally:
+        # Clean up just the specific file, not the entire folder
+        if cleanup and download_path.exists():
+            try:
+                download_path.unlink()  # Remove just the file
+                print(f"Deleted file: {download_path}")
+            except Exception as e:
+                print(f"Error deleting file {download_path}: {e}")
+
+# ========== Archive Stage ==========
+def url_source(url):
+    """Archive source streaming a URL"""
+    async def open_source():
+        file_name = await asyncio.to_thread(get_url_file_name, url)
+        response = await http_get(url)
+        response.raise_for_status()
+        size = int(response.headers.get('content-length', 0)) or None
+        return file_name, size, iter_response(response)
+    return open_source
+
+def file_source(path):
+    """Archive source reading a local file"""
+    async def open_source():
+        size = path.stat().st_size
+
+        async def chunks():
+            with open(path, 'rb') as f:
+                while chunk := await asyncio.to_thread(f.read, 1024 * 1024):
+                    yield chunk
+        return path.name, size, chunks()
+    return open_source
+
+async def archive_to_rclone(sources, archive_name, fmt, remote, path, config_path, sink, job=None):
+    """
+    Pack sources into an archive while they download and stream it into
+    'rclone rcat', so the archive is never written to local disk.
+    Sources are async callables returning (name, size, chunk iterator).
+    Returns the archive size in bytes if successful, False if failed
+    """
+    remote_path = f"{remote}:{path}/{archive_name}" if path else f"{remote}:{archive_name}"
+    try:
+        writer = ArchiveWriter(fmt)
+    except ValueError as e:
+        await sink.finish(False, f"❌ {e}")
+        return False
+
+    if job:
+        job.priority = "bulk"
+        bandwidth.rebalance()
+
+    config = rclone_configs.get(config_path) if config_path else None
+    if config and not config.capabilities(remote)["stream_upload"]:
+        await sink.status(f"⚠️ {remote} doesn't support streaming uploads, rclone will buffer the archive")
+
+    bytes_in = 0
+    bytes_out = 0
+
+    async def send(stdin):
+        nonlocal bytes_out
+        data = writer.read_pending()
+        if not data:
+            return
+        if job:
+            await bandwidth.throttle(job, len(data))
+        stdin.write(data)
+        await stdin.drain()
+        bytes_out += len(data)
+
+    async def feed(stdin):
+        nonlocal bytes_in
+        used_names = set()
+        for index, open_source in enumerate(sources, 1):
+            name, size, chunks = await open_source()
+
+            # Keep member names unique inside the archive
+            member_name, counter = name, 1
+            while member_name in used_names:
+                counter += 1
+                member_name = f"{counter}_{name}"
+            used_names.add(member_name)
+
+            await sink.status(f"📦 Packing {member_name} ({index}/{len(sources)})\n➡️ {remote_path}")
+            writer.start_member(member_name, size)
+            written = 0
+            last_update_time = time.time()
+            last_written = 0
+            async for chunk in chunks:
+                if job:
+                    await job.checkpoint()
+                # Compression is CPU-bound, keep it off the event loop
+                await asyncio.to_thread(writer.write, chunk)
+                written += len(chunk)
+                bytes_in += len(chunk)
+                await send(stdin)
+
+                current_time = time.time()
+                time_diff = current_time - last_update_time
+                if size and time_diff >= 0.5:
+                    await sink.progress(
+                        "upload", f"{archive_name}/{member_name}", written, size,
+                        (written - last_written) / time_diff, target=remote
+                    )
+                    last_update_time = current_time
+                    last_written = written
+            await asyncio.to_thread(writer.end_member)
+            await send(stdin)
+        await asyncio.to_thread(writer.close)
+        await send(stdin)
+
+    try:
+        returncode, stderr = await rclone.stream(
+            ["rcat", remote_path], config_path=config_path, remote=remote, feed=feed
+        )
+    except Exception as e:
+        await sink.finish(False, f"❌ Archive upload failed: {str(e)[:1000]}")
+        return False
+
+    if returncode == 0:
+        await sink.finish(
+            True,
+            f"✅ Successfully uploaded to `{remote_path}`\n"
+            f"📄 **Items:** `{len(sources)}`\n"
+            f"📦 **Size:** `{format_size(bytes_out)}` (from `{format_size(bytes_in)}`)"
+        )
+        return bytes_out
+    error_details = '\n'.join(stderr.splitlines()[-5:])
+    await sink.finish(
+        False,
+        f"❌ Archive upload failed with error code {returncode}\n\n"
+        f"Error details:\n{error_details}"
+    )
+    return False